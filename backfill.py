@@ -0,0 +1,224 @@
+"""
+Batch summarizer for a backlog of recordings.
+
+Examples:
+    python backfill.py                                  # every recording in recordings/
+    python backfill.py --from 2025-01-01 --to 2025-03-31 --workers 4 --rate 20
+    python backfill.py --write cloud --user ryo         # push summaries to Supabase
+    python backfill.py --cloud-user ryo --write cloud --user ryo   # re-summarize cloud entries
+
+Entries whose summary the user edited are left alone unless --include-edited is given.
+Progress is checkpointed after every entry, so re-running the same command resumes.
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+
+from modules import ai, audio, database
+
+DATE_FILE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.(wav|flac|ogg)$")
+EXT_TO_CODEC = {ext: codec for codec, (ext, _) in audio.CODECS.items()}
+
+
+class RateLimiter:
+    """Spaces out calls so we never start more than `per_minute` in any minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Checkpoint:
+    """Remembers which dates are done (or failed) in a small JSON file."""
+
+    def __init__(self, path, restart=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {"done": [], "failed": {}}
+        if os.path.exists(path) and not restart:
+            with open(path, "r") as f:
+                self.state = json.load(f)
+
+    def is_done(self, date_str):
+        return date_str in self.state["done"]
+
+    def record(self, date_str, error=None):
+        with self.lock:
+            if error is None:
+                self.state["done"].append(date_str)
+                self.state["failed"].pop(date_str, None)
+            else:
+                self.state["failed"][date_str] = str(error)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def local_jobs(audio_dir, start, end):
+    """Yields (date, codec, load_audio) for recordings named like 2025-12-17.wav."""
+    for name in sorted(os.listdir(audio_dir)):
+        match = DATE_FILE.match(name)
+        if not match or (start and match.group(1) < start) or (end and match.group(1) > end):
+            continue
+        path = os.path.join(audio_dir, name)
+
+        def load_audio(path=path):
+            with open(path, "rb") as f:
+                return f.read()
+        yield match.group(1), EXT_TO_CODEC[match.group(2)], load_audio
+
+
+def cloud_jobs(user_id, start, end):
+    """Yields (date, codec, load_audio) for a user's cloud entries that have audio. Raises if they can't be listed."""
+    from modules import cloud_db
+    entries = cloud_db.fetch_entries_in_range(user_id, start, end, viewer_is_owner=True)
+    for date_str in sorted(entries):
+        entry = entries[date_str]
+        if not entry.get("audio_url"):
+            continue
+
+        def load_audio(url=entry["audio_url"]):
+            response = httpx.get(url, timeout=60.0, follow_redirects=True)
+            response.raise_for_status()
+            return response.content
+        yield date_str, entry.get("audio_codec") or "wav", load_audio
+
+
+def existing_entries(args, start, end):
+    """Entries already stored where we write (local or cloud) between start and end. Raises if unknown."""
+    if args.write == "local":
+        return {d: e for d, e in database.load_db().items()
+                if (not start or d >= start) and (not end or d <= end)}
+    from modules import cloud_db
+    return cloud_db.fetch_entries_in_range(args.user, start, end, viewer_is_owner=True)
+
+
+def existing_entry(date_str, args):
+    return existing_entries(args, date_str, date_str).get(date_str)
+
+
+def is_protected(entry, args):
+    """Summaries the user edited ("Edited & Finalized") are only replaced with --include-edited."""
+    return entry is not None and entry.get("is_edited") and not args.include_edited
+
+
+def write_summary(date_str, summary, audio_bytes, codec, args):
+    """
+    Stores the new summary locally or in Supabase. Not marked as a human edit.
+    Returns False (and writes nothing) if the user edited the entry in the meantime.
+    """
+    entry = existing_entry(date_str, args)
+    if is_protected(entry, args):
+        return False
+    if args.write == "local":
+        if entry is not None:
+            database.update_local_text(date_str, summary, is_edited=False)
+        else:
+            database.save_entry(date_str, summary, audio_bytes, None, audio_codec=codec)
+    else:
+        from modules import cloud_db
+        if entry is not None:
+            ok = cloud_db.update_summary(date_str, args.user, summary, is_edited=False)
+        else:
+            ok = cloud_db.save_to_cloud(date_str, summary, audio_bytes, None, user_id=args.user, audio_codec=codec)
+        if not ok:
+            raise RuntimeError("cloud write failed")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a backlog of diary recordings.")
+    parser.add_argument("--dir", default=database.AUDIO_DIR, help="folder of YYYY-MM-DD.wav/.flac/.ogg files")
+    parser.add_argument("--cloud-user", help="re-summarize this user's cloud entries instead of --dir")
+    parser.add_argument("--from", dest="start", help="first date (YYYY-MM-DD, default: no limit)")
+    parser.add_argument("--to", dest="end", help="last date (YYYY-MM-DD, default: no limit)")
+    parser.add_argument("--write", choices=["local", "cloud"], default="local")
+    parser.add_argument("--user", help="owner of the entries when writing to the cloud")
+    parser.add_argument("--workers", type=int, default=4, help="summaries in flight at once")
+    parser.add_argument("--rate", type=float, default=30, help="max summaries started per minute (0 = no limit)")
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and redo everything")
+    parser.add_argument("--include-edited", action="store_true",
+                        help="also replace summaries the user edited and finalized")
+    args = parser.parse_args()
+
+    if args.write == "cloud" and not args.user:
+        parser.error("--write cloud needs --user")
+
+    try:
+        if args.cloud_user:
+            jobs = list(cloud_jobs(args.cloud_user, args.start, args.end))
+        else:
+            jobs = list(local_jobs(args.dir, args.start, args.end))
+    except Exception as e:
+        raise SystemExit(f"❌ Couldn't list recordings: {e}")
+
+    checkpoint = Checkpoint(args.checkpoint, restart=args.restart)
+    pending = [job for job in jobs if not checkpoint.is_done(job[0])]
+    # Checked again right before writing, in case the user edits one while we run
+    try:
+        stored = existing_entries(args, args.start, args.end)
+    except Exception as e:
+        raise SystemExit(f"❌ Couldn't read the existing entries: {e}")
+    edited = {job[0] for job in pending if is_protected(stored.get(job[0]), args)}
+    pending = [job for job in pending if job[0] not in edited]
+    print(f"📼 {len(pending)} recordings to summarize ({len(checkpoint.state['done'])} already done, "
+          f"{len(edited)} edited by hand and skipped)")
+
+    limiter = RateLimiter(args.rate)
+
+    def process(date_str, codec, load_audio):
+        audio_bytes = load_audio()
+        limiter.wait()
+        # Batch priority: anyone using the app while this runs goes first
+        summary = ai.summarize_audio(audio_bytes, codec=codec, priority=ai.PRIORITY_BATCH)
+        return write_summary(date_str, summary, audio_bytes, codec, args)
+
+    started = time.monotonic()
+    succeeded, failed, skipped = 0, 0, len(edited)
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(process, *job): job[0] for job in pending}
+        for future in as_completed(futures):
+            date_str = futures[future]
+            try:
+                if not future.result():
+                    skipped += 1
+                    print(f"  ⏭️ {date_str}: edited while we ran, kept the user's summary")
+                    continue
+                checkpoint.record(date_str)
+                succeeded += 1
+                print(f"  ✅ {date_str}")
+            except Exception as e:
+                checkpoint.record(date_str, error=e)
+                failed += 1
+                print(f"  ❌ {date_str}: {e}")
+
+    minutes = (time.monotonic() - started) / 60
+    rate = succeeded / minutes if minutes > 0 else 0.0
+    print(f"\nDone in {datetime.timedelta(seconds=round(minutes * 60))}: "
+          f"{succeeded} summarized, {failed} failed, {skipped} edited and skipped, {rate:.1f} entries/min")
+    if checkpoint.state["failed"]:
+        print("Failures (re-run to retry):")
+        for date_str, error in sorted(checkpoint.state["failed"].items()):
+            print(f"  {date_str}: {error}")
+
+
+if __name__ == "__main__":
+    main()
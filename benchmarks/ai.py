@@ -0,0 +1,86 @@
+"""
+Concurrency benchmark for ai.GeminiBackend:
+    python -m benchmarks.ai [sessions] [calls_per_session]
+
+Gemini is replaced (patched from here) by a stand-in that answers with a hash of the audio
+it received, so a session that gets someone else's answer was fed someone else's recording.
+Compares the previous temp-file path with the in-memory one.
+"""
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+
+from modules import ai, audio
+
+UPLOAD_LATENCY = 0.002  # Files API round trip, kept small so the benchmark is quick
+
+
+class Answer:
+    def __init__(self, text):
+        self.text = text
+
+
+def stand_in_upload(source, mime_type=None):
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.read()
+    time.sleep(UPLOAD_LATENCY)
+    return {"mime_type": mime_type, "data": data}
+
+
+def stand_in_generate(self, contents, stream=False):
+    return Answer(hashlib.sha256(contents[1]["data"]).hexdigest())
+
+
+def temp_file_summarize(backend, audio_bytes, codec="wav"):
+    """The previous GeminiBackend.summarize: shared temp file, upload, new model every call."""
+    temp_path = f"temp_upload.{audio.extension(codec)}"
+    with open(temp_path, "wb") as f:
+        f.write(audio_bytes)
+    try:
+        myfile = genai.upload_file(temp_path, mime_type=audio.mime_type(codec))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    model = genai.GenerativeModel(backend.model_name)
+    return model.generate_content([backend.prompt, myfile]).text
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    genai.upload_file = stand_in_upload
+    genai.GenerativeModel.generate_content = stand_in_generate
+
+    backend = ai.GeminiBackend()
+    recordings = [os.urandom(256 * 1024) for _ in range(sessions)]  # about 8 s of 16 kHz mono WAV each
+
+    def session(summarize, index):
+        wrong = 0
+        expected = hashlib.sha256(recordings[index]).hexdigest()
+        for _ in range(calls):
+            try:
+                wrong += summarize(backend, recordings[index]) != expected
+            except OSError:
+                wrong += 1  # another session removed the shared temp file first
+        return wrong
+
+    for name, summarize in (("temp file + new model", temp_file_summarize),
+                            ("in memory + shared model", lambda b, data: b.summarize(data))):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            wrong = sum(pool.map(lambda i: session(summarize, i), range(sessions)))
+        elapsed = time.perf_counter() - started
+        total = sessions * calls
+        print(f"{name:26} {total} calls from {sessions} sessions: {elapsed / total * 1000:6.2f} ms/call, "
+              f"{wrong} wrong or failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+cloud_db benchmarks against latency-injecting stand-ins (no Supabase needed).
+The stand-ins are patched into modules.cloud_db from here; the module itself is unchanged.
+
+    python -m benchmarks.cloud_db uploads [--latency 0.3]
+    python -m benchmarks.cloud_db singleflight [--threads 50] [--latency 0.3]
+    python -m benchmarks.cloud_db sessions [--threads 50] [--latency 0.3]   (local HTTP stand-in)
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from supabase import create_client
+
+from modules import cloud_db
+
+
+class StandIn:
+    """Just enough of the Supabase client for these benchmarks; every call sleeps `latency`."""
+
+    def __init__(self, latency, rows=()):
+        self.latency = latency
+        self.rows = list(rows)
+        self.calls = 0
+        self.storage = self
+        self._lock = threading.Lock()
+
+    def _hit(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+    # storage.from_(bucket).upload(...) / .get_public_url(...)
+    def from_(self, bucket):
+        return self
+
+    def upload(self, path, file, file_options=None):
+        if hasattr(file, "read"):
+            file.read()
+        self._hit()
+
+    def get_public_url(self, path):
+        return f"https://stand-in/{path}"
+
+    # table(name).select(...).eq(...)...execute()
+    def table(self, name):
+        return StandInQuery(self)
+
+
+class StandInQuery:
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.client._hit()
+        return type("Response", (), {"data": [dict(row) for row in self.client.rows]})
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Local Supabase stand-in over real HTTP: password login, logout, and empty table reads."""
+    protocol_version = "HTTP/1.1"  # keep-alive, so reused connections show up in the count
+    latency = 0.0
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=None):
+        time.sleep(self.latency)
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._send(200, [])
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.startswith("/auth/v1/logout"):
+            return self._send(204)
+        username = body.get("email", "").split("@")[0]
+        self._send(200, {
+            "access_token": "stand.in.token", "refresh_token": "stand-in", "token_type": "bearer",
+            "expires_in": 3600, "expires_at": int(time.time()) + 3600,
+            "user": {"id": "00000000-0000-0000-0000-000000000000", "aud": "authenticated",
+                     "created_at": "2025-01-01T00:00:00Z", "app_metadata": {},
+                     "user_metadata": {"username": username}},
+        })
+
+
+class StandInHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 256  # every benchmark session may connect at the same moment
+    daemon_threads = True
+
+
+def bench_uploads(args):
+    """save_to_cloud (concurrent uploads) vs uploading the same assets one after another."""
+    cloud_db.supabase = StandIn(args.latency)
+    audio_bytes = os.urandom(512 * 1024)
+    original = os.urandom(1024 * 1024)
+
+    started = time.perf_counter()
+    cloud_db.upload_file(audio_bytes, "audio/bench/a.ogg", content_type="audio/ogg")
+    cloud_db.upload_file(original, "audio/bench/a.original.wav", content_type="audio/wav")
+    cloud_db.supabase.table("entries").upsert({}).execute()
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ok = cloud_db.save_to_cloud("2025-01-01", "bench", audio_bytes, None, user_id="bench",
+                                audio_codec="opus", original_audio=original)
+    concurrent = time.perf_counter() - started
+    print(f"{args.latency * 1000:.0f} ms per storage call: sequential {sequential:.2f}s | "
+          f"save_to_cloud {concurrent:.2f}s (saved={ok})")
+
+
+def bench_singleflight(args):
+    """N threads released at once asking for the same popular diary, with and without coalescing."""
+    row = {"id": 1, "date": "2025-01-01", "summary": "bench", "audio_url": None, "image_url": None,
+           "is_public": True, "sender": "syd", "receiver": "bench", "status": "accepted"}
+    stand_in = cloud_db.supabase = StandIn(args.latency, rows=[row])
+    cloud_db.DELTA_SYNC = False
+    reads = {
+        "fetch_entries_by_user": lambda: cloud_db.fetch_entries_by_user("syd"),
+        "fetch_entry_dates": lambda: cloud_db.fetch_entry_dates("syd"),
+        "fetch_entry": lambda: cloud_db.fetch_entry("syd", "2025-01-01"),
+        "get_my_friends": lambda: cloud_db.get_my_friends("bench"),
+    }
+    coalesced = cloud_db._singleflight
+
+    def hammer(read):
+        cloud_db.invalidate_cache()
+        cloud_db.invalidate_friends()
+        stand_in.calls = 0
+        barrier = threading.Barrier(args.threads)
+
+        def worker():
+            barrier.wait()
+            return read()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = [f.result() for f in [pool.submit(worker) for _ in range(args.threads)]]
+        return stand_in.calls, time.perf_counter() - started, all(r == results[0] for r in results)
+
+    print(f"{args.threads} threads, {args.latency * 1000:.0f} ms per backend call")
+    for name, read in reads.items():
+        cloud_db._singleflight = lambda key, fn: fn()
+        plain_calls, plain_seconds, _ = hammer(read)
+        cloud_db._singleflight = coalesced
+        calls, seconds, same = hammer(read)
+        print(f"    {name:22} backend calls {plain_calls:3} -> {calls:3} | "
+              f"{plain_seconds:.2f}s -> {seconds:.2f}s | identical results: {same}")
+    for key, stats in cloud_db.get_singleflight_stats().items():
+        print(f"    {key}: {stats}")
+
+
+def bench_sessions(args):
+    """
+    N concurrent browser sessions (login, a few reruns, then half log out and half just leave)
+    with pooled session clients vs a brand-new client for every request.
+    """
+    StandInHandler.latency = args.latency
+    server = StandInHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url, key = f"http://127.0.0.1:{server.server_port}", "stand.in.key"
+    cloud_db.SUPABASE_URL, cloud_db.SUPABASE_KEY = url, key
+    cloud_db.supabase = cloud_db._create_client()
+    reruns = 5
+
+    def refresh_timers():
+        # Cancelled timers can linger for a moment before their thread exits; don't count those
+        return sum(isinstance(t, threading.Timer) and not t.finished.is_set() for t in threading.enumerate())
+
+    def pooled(i):
+        session_key, wrong = f"bench-{i}", 0
+        cloud_db.login(f"user{i}", "pw", session_key)
+        for _ in range(reruns):
+            wrong += cloud_db.get_current_user(session_key) != f"user{i}"
+            cloud_db.supabase.table("entries").select("date").eq("user_id", f"user{i}").execute()
+        if i % 2 == 0:
+            cloud_db.logout(session_key)
+        return wrong
+
+    def client_per_request(i):
+        wrong = 0
+        for _ in range(reruns):
+            client = create_client(url, key)  # own connection pool, new login
+            response = client.auth.sign_in_with_password({"email": f"user{i}@{cloud_db.DUMMY_DOMAIN}", "password": "pw"})
+            wrong += response.user.user_metadata.get("username") != f"user{i}"
+            client.table("entries").select("date").eq("user_id", f"user{i}").execute()
+        return wrong
+
+    print(f"{args.threads} sessions x {reruns} reruns, {args.latency * 1000:.0f} ms per request")
+    for name, session in (("new client per request", client_per_request), ("pooled session clients", pooled)):
+        StandInHandler.connections = 0
+        timers_before = refresh_timers()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            wrong = sum(pool.map(session, range(args.threads)))
+        elapsed = time.perf_counter() - started
+        print(f"    {name:23} {elapsed:5.2f}s | {StandInHandler.connections:4} TCP connections | "
+              f"wrong user {wrong} | refresh timers left {refresh_timers() - timers_before}")
+
+    # The sessions that never logged out are idle; the next request evicts and signs them out
+    cloud_db.SESSION_IDLE_SECONDS = 0
+    cloud_db.get_session_client("bench-evictor", create=False)
+    cloud_db._session_close_pool.submit(lambda: None).result()
+    print(f"    after idle eviction: refresh timers left {refresh_timers() - timers_before} | "
+          f"{cloud_db.get_session_pool_stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="cloud_db benchmarks against a latency-injecting stand-in")
+    parser.add_argument("bench", choices=["uploads", "singleflight", "sessions"])
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds added to every stand-in call")
+    parser.add_argument("--threads", type=int, default=50, help="concurrent callers (singleflight, sessions)")
+    args = parser.parse_args()
+    {"uploads": bench_uploads, "singleflight": bench_singleflight, "sessions": bench_sessions}[args.bench](args)
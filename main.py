@@ -1,8 +1,9 @@
 import streamlit as st
 import datetime
 import os
-from modules import ai, mac_photos, image_loader, cloud_db
-from PIL import Image, ExifTags
+import time
+import uuid
+from modules import ai, image_loader, cloud_db, database, summary_jobs, photo_index, exif_meta, notifications
 
 
 # ==========================================
@@ -11,13 +12,11 @@ from PIL import Image, ExifTags
 if "logged_in_user" not in st.session_state:
     st.session_state.logged_in_user = None
 
-# If we aren't logged in, ask Supabase: "Do you remember this person?"
-if not st.session_state.logged_in_user:
-    # This checks the browser's local storage for a token
-    auto_user = cloud_db.get_current_user()
-    if auto_user:
-        st.session_state.logged_in_user = auto_user
-        st.toast(f"Welcome back, {auto_user}!")
+# Identifies this browser session's own Supabase client (login state isn't shared between users).
+# It lives only as long as the Streamlit session, so a page refresh means logging in again.
+# (Keeping it in the URL would make every shared link a login; Streamlit can't set cookies.)
+if "session_key" not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex
 
 if "step" not in st.session_state:
     st.session_state.step = 1
@@ -41,7 +40,7 @@ if not st.session_state.logged_in_user:
         
         if st.button("Log In", key="btn_login"):
             with st.spinner("Unlocking..."):
-                username = cloud_db.login(l_user, l_pass)
+                username = cloud_db.login(l_user, l_pass, st.session_state.session_key)
                 if username:
                     st.session_state.logged_in_user = username
                     st.success(f"Welcome back, {username}!")
@@ -70,13 +69,45 @@ if not st.session_state.logged_in_user:
     
     st.stop()
 
+# Pick up a summary job started in an earlier session (e.g. after a page refresh).
+# Only after login, and only the user's own: the job id in the URL is not a secret.
+if "summary_job" not in st.session_state:
+    st.session_state.summary_job = None
+    resumed_job = st.query_params.get("job")
+    job_date = st.query_params.get("job_date")
+    job = summary_jobs.get_job(resumed_job) if resumed_job and job_date else None
+    if job and job["user_id"] == st.session_state.logged_in_user:
+        st.session_state.summary_job = resumed_job
+        st.session_state.date_picker = datetime.date.fromisoformat(job_date)
+        st.session_state.last_date = job_date
+        st.session_state.step = 2
+    elif resumed_job:
+        st.query_params.pop("job", None)
+        st.query_params.pop("job_date", None)
+
 # ==========================================
 # CHECK NOTIFICATIONS (New!)
 # ==========================================
-# This runs every time you click a button or refresh
-new_notifs = cloud_db.check_notifications(st.session_state.logged_in_user)
-for msg in new_notifs:
-    st.toast(msg, icon="🔔") # Shows a nice popup in the corner
+# A background poller fetches them; here we only read its in-memory inbox (no network call)
+if st.session_state.get("notif_user") != st.session_state.logged_in_user:
+    st.session_state.notif_user = st.session_state.logged_in_user
+    st.session_state.notif_seq = notifications.subscribe(st.session_state.logged_in_user)
+
+
+@st.fragment(run_every=notifications.POLL_INTERVAL_SECONDS)
+def show_notifications():
+    # Re-runs on its own so toasts show up without clicking anything
+    new_notifs, st.session_state.notif_seq = notifications.drain(
+        st.session_state.notif_user, st.session_state.notif_seq
+    )
+    for msg in new_notifs:
+        st.toast(msg, icon="🔔") # Shows a nice popup in the corner
+    if new_notifs:
+        # Notifications are about friend requests, so the cached friend list may be stale
+        cloud_db.invalidate_friends(st.session_state.notif_user)
+
+
+show_notifications()
 
 # ==========================================
 # 3. MAIN APP SETUP
@@ -86,8 +117,14 @@ current_user = st.session_state.logged_in_user
 # Sidebar: Logout
 st.sidebar.title(f"👋 Hi, {current_user.title()}")
 if st.sidebar.button("Log Out"):
-    cloud_db.logout()
+    cloud_db.logout(st.session_state.session_key)
     st.session_state.logged_in_user = None
+    # The next person to log in on this tab must not inherit the recording in progress
+    for key in ("summary_job", "temp_audio", "temp_audio_original", "temp_summary"):
+        st.session_state.pop(key, None)
+    st.query_params.pop("job", None)
+    st.query_params.pop("job_date", None)
+    st.session_state.step = 1
     st.rerun()
 
 
@@ -100,7 +137,7 @@ search_term = st.sidebar.text_input("Find keyword")
 # SIDEBAR: SOCIAL & NAVIGATION
 # ==========================================
 st.sidebar.markdown("---")
-view_mode = st.sidebar.radio("View Mode", ["📖 My Diary", "👥 Friends"])
+view_mode = st.sidebar.radio("View Mode", ["📖 My Diary", "👥 Friends", "📰 Friends Feed"])
 
 active_user_view = current_user # Default to viewing myself
 
@@ -121,14 +158,14 @@ if view_mode.startswith("👥 Friends"):
     
     
     if selected_friend:
-        # Load THEIR public entries
-        db = cloud_db.fetch_entries_by_user(selected_friend, viewer_is_owner=False)
+        # Load which dates THEY have public entries for (entries load lazily below)
+        entry_dates = cloud_db.fetch_entry_dates(selected_friend, viewer_is_owner=False)
         is_read_only = True
         active_user_view = selected_friend
     else:
         # No friend selected (or no friends)
         st.write("👈 Select a friend to see their updates.")
-        db = {}
+        entry_dates = set()
         is_read_only = True
 
     # 3. Add Friend & Requests (In an Expander to keep it clean)
@@ -155,10 +192,44 @@ if view_mode.startswith("👥 Friends"):
         else:
             st.caption("*No new requests*")
 
+# --- FRIENDS FEED LOGIC ---
+elif view_mode.startswith("📰"):
+    st.title("📰 Friends Feed")
+    my_friends = cloud_db.get_my_friends(current_user)
+    if not my_friends:
+        st.info("No friends yet. Add someone in 👥 Friends!")
+        st.stop()
+
+    # Pages are kept in session state; "Load more" fetches just the next one
+    refresh = st.sidebar.button("🔄 Refresh Feed")
+    feed = st.session_state.get("feed")
+    if feed is None or feed["friends"] != my_friends or refresh:
+        items, cursor = cloud_db.fetch_feed_page(my_friends)
+        feed = st.session_state.feed = {"friends": my_friends, "items": items, "cursor": cursor}
+
+    if not feed["items"]:
+        st.write("Nothing public from your friends yet.")
+    for friend, entry_date, feed_entry in feed["items"]:
+        st.markdown(f"#### {friend.title()} · {entry_date}")
+        photo_url = feed_entry.get("image_thumb_url") or feed_entry.get("image_url")
+        if photo_url:
+            st.image(photo_url)
+        st.markdown(feed_entry["summary"])
+        if feed_entry.get("audio_url"):
+            st.audio(feed_entry["audio_url"])
+        st.markdown("---")
+
+    if feed["cursor"] and st.button("Load more"):
+        items, cursor = cloud_db.fetch_feed_page(my_friends, cursor=feed["cursor"])
+        feed["items"] += items
+        feed["cursor"] = cursor
+        st.rerun()
+    st.stop()
+
 # --- MY DIARY LOGIC ---
 else:
     # "My Diary" - Standard View
-    db = cloud_db.fetch_entries_by_user(current_user, viewer_is_owner=True)
+    entry_dates = cloud_db.fetch_entry_dates(current_user, viewer_is_owner=True)
     is_read_only = False
     active_user_view = current_user
 
@@ -175,9 +246,11 @@ def go_to_date(new_date):
     st.session_state.date_picker = new_date
 
 if search_term:
-    results = [d for d, data in db.items() if search_term.lower() in data["summary"].lower()]
-    st.sidebar.markdown(f"**Found {len(results)} entries:**")
-    for date_result in results:
+    # The app saves to Supabase, so that's where search runs. (The local store's ranked
+    # search, database.search_entries, is for data written locally, e.g. backfill --write local.)
+    found = cloud_db.search_entries(active_user_view, search_term, viewer_is_owner=not is_read_only)
+    st.sidebar.markdown(f"**Found {len(found)} entries:**")
+    for date_result in found:
         y, m, d = map(int, date_result.split("-"))
         st.sidebar.button(f"📅 {date_result}", key=f"btn_{date_result}", on_click=go_to_date, args=(datetime.date(y, m, d),))
 
@@ -192,12 +265,22 @@ if "last_date" not in st.session_state or st.session_state.last_date != date_str
     st.session_state.last_date = date_str
     st.session_state.step = 1
     st.session_state.selected_photo = None
+    if st.session_state.summary_job:
+        # The draft for the old date is abandoned; don't keep its recording around
+        summary_jobs.finish_job(st.session_state.summary_job)
+    st.session_state.summary_job = None
+    st.query_params.pop("job", None)
+    st.query_params.pop("job_date", None)
 
 # ==========================================
 # 4. VIEW MODE
 # ==========================================
-if date_str in db:
-    entry = db[date_str]
+entry = None
+if date_str in entry_dates:
+    # Only the entry on screen is downloaded in full
+    entry = cloud_db.fetch_entry(active_user_view, date_str, viewer_is_owner=not is_read_only)
+
+if entry:
     
     # 1. PHOTO
     local_path = entry.get("image_path")
@@ -206,7 +289,7 @@ if date_str in db:
     st.caption(f"📅 Memory from {date_str}")
 
     if local_path and os.path.exists(local_path):
-        img_data = image_loader.load_image_for_streamlit(local_path)
+        img_data = image_loader.load_image_for_streamlit(local_path, size="display")
         if img_data: st.image(img_data)
     elif cloud_url:
         st.image(cloud_url)
@@ -285,13 +368,15 @@ else:
     if st.session_state.step == 1:
         st.info("Step 1: Choose a photo")
         
-        # A. Try Mac Photos
-        suggested_photos = mac_photos.get_photos_from_mac_library(selected_date)
+        # A. Photos taken that day: indexed folders (PHOTO_DIRS), plus the Mac library if enabled
+        # (both come from in-memory date maps, so this is instant on every rerun)
+        suggested_photos = photo_index.photos_for_date(selected_date)
         if suggested_photos:
-            st.write("📸 From your Mac Library:")
+            st.write("📸 Photos from this day:")
             cols = st.columns(3)
-            for idx, photo_path in enumerate(suggested_photos):
-                img_data = image_loader.load_image_for_streamlit(photo_path)
+            # Thumbnails render in parallel and show up one by one as they're ready
+            thumbnails = image_loader.load_images_parallel(suggested_photos, size="thumbnail")
+            for idx, (photo_path, img_data) in enumerate(thumbnails):
                 if img_data:
                     with cols[idx % 3]:
                         st.image(img_data)
@@ -307,20 +392,12 @@ else:
         
         if uploaded_file is not None:
             try:
-                # 1. Open Image to check metadata
-                img = Image.open(uploaded_file)
-                exif_data = img._getexif()
-                photo_date = None
-
-                if exif_data:
-                    # Look for DateTimeOriginal (Tag 36867)
-                    for tag, value in exif_data.items():
-                        tag_name = ExifTags.TAGS.get(tag, tag)
-                        if tag_name == "DateTimeOriginal":
-                            # Format is usually "YYYY:MM:DD HH:MM:SS"
-                            date_part = value.split(" ")[0].replace(":", "-")
-                            photo_date = date_part
-                            break
+                # 1. Check metadata (reads only the EXIF header, once per uploaded file)
+                cached_meta = st.session_state.get("upload_meta")
+                if not cached_meta or cached_meta[0] != uploaded_file.file_id:
+                    cached_meta = (uploaded_file.file_id, exif_meta.read_metadata(uploaded_file))
+                    st.session_state.upload_meta = cached_meta
+                photo_date = cached_meta[1]["capture_date"]
                 
                 # 2. Validate Date
                 target_date_str = str(selected_date)
@@ -333,7 +410,9 @@ else:
                         st.warning("⚠️ No date found in photo metadata. Accepting anyway (be careful!).")
                     
                     # 3. Save Temp File (Only if valid)
-                    temp_filename = f"temp_upload_{selected_date}.jpg"
+                    # Keep the real extension (PNG/HEIC saved as .jpg confuses everything downstream)
+                    ext = os.path.splitext(uploaded_file.name)[1].lower() or ".jpg"
+                    temp_filename = f"temp_upload_{selected_date}{ext}"
                     with open(temp_filename, "wb") as f:
                         f.write(uploaded_file.getbuffer())
                     
@@ -354,18 +433,72 @@ else:
     elif st.session_state.step == 2:
         st.info("Step 2: Record your thoughts")
         if st.session_state.selected_photo:
-            preview = image_loader.load_image_for_streamlit(st.session_state.selected_photo)
+            preview = image_loader.load_image_for_streamlit(st.session_state.selected_photo, size="thumbnail")
             if preview: st.image(preview, width=150)
 
+        job_id = st.session_state.summary_job
+        if job_id:
+            # A summary is being generated in the background; poll until it's ready
+            job = summary_jobs.get_job(job_id)
+            if job is None or job["status"] in ("failed", "cancelled"):
+                if job and job["status"] == "cancelled":
+                    st.warning("⏹️ Summary cancelled.")
+                else:
+                    st.error(f"❌ Couldn't summarize: {job['error'] if job else 'job not found'}")
+                if st.button("🎙️ Record again"):
+                    summary_jobs.finish_job(job_id)
+                    st.session_state.summary_job = None
+                    st.query_params.pop("job", None)
+                    st.query_params.pop("job_date", None)
+                    st.rerun()
+            elif job["status"] == "done":
+                if "temp_audio" not in st.session_state:
+                    # The trimmed, encoded recording only exists in the job's copy
+                    st.session_state.temp_audio = summary_jobs.load_job_audio(job_id)
+                    st.session_state.temp_audio_codec = job["codec"]
+                    if job["trimmed_seconds"]:
+                        st.toast(f"✂️ Trimmed {job['trimmed_seconds']:.1f}s of silence")
+                st.session_state.temp_summary = job["summary"]
+                st.session_state.is_edited_flag = False
+                st.session_state.is_editing_mode = False
+                st.session_state.step = 3
+                st.rerun()
+            else:
+                # Show the bullets that have arrived so far while the rest streams in
+                st.subheader("📝 AI Summary")
+                if job["partial"]:
+                    st.markdown(job["partial"] + " ▌")
+                else:
+                    # Busy server: tell the user roughly how long they'll wait
+                    load = ai.get_scheduler_stats()
+                    if load["queue_depth"] > 0:
+                        st.caption(f"🚦 {load['queue_depth']} in line, about {load['estimated_wait_seconds']:.0f}s wait")
+                if st.button("⏹️ Cancel"):
+                    summary_jobs.cancel(job_id)
+                    st.rerun()
+                with st.spinner("Generating AI Summary... (you can refresh, it keeps going)"):
+                    time.sleep(0.3)
+                st.rerun()
+            st.stop()
+
+        trim_col, keep_col = st.columns(2)
+        trim = trim_col.checkbox("✂️ Trim silence", value=True)
+        keep_original = keep_col.checkbox("Keep untrimmed original", value=False, disabled=not trim)
+
         audio_value = st.audio_input(f"Record for {date_str}")
         if audio_value:
-            st.spinner("Generating AI Summary...")
-            st.session_state.temp_audio = audio_value.read()
-            st.session_state.temp_summary = ai.summarize_audio(st.session_state.temp_audio)
-            
-            st.session_state.is_edited_flag = False 
-            st.session_state.is_editing_mode = False
-            st.session_state.step = 3
+            # getbuffer() is a zero-copy view of the recording (no extra copy of the WAV)
+            raw_audio = audio_value.getbuffer()
+            st.session_state.temp_audio_original = raw_audio if (trim and keep_original) else None
+
+            # Hand the recording off to the job queue and come back to poll it. The job's worker
+            # trims + compresses it first (so the page never waits on that); Gemini and Supabase
+            # both get the smaller file, which is picked up below once the job is done.
+            st.session_state.pop("temp_audio", None)
+            job_id = summary_jobs.submit(raw_audio, user_id=current_user, prepare=True, trim=trim)
+            st.session_state.summary_job = job_id
+            st.query_params["job"] = job_id
+            st.query_params["job_date"] = date_str
             st.rerun()
 
     # STEP 3: REVIEW
@@ -402,18 +535,30 @@ else:
         if st.button("🚀 Upload & Save"):
             with st.spinner("Saving to Cloud..."):
                 try:
-                    cloud_db.save_to_cloud(
+                    saved = cloud_db.save_to_cloud(
                         date_str, 
                         st.session_state.temp_summary, 
                         st.session_state.temp_audio,
                         st.session_state.selected_photo,
                         user_id=current_user,
                         is_public=is_public,
-                        is_edited=st.session_state.is_edited_flag
+                        is_edited=st.session_state.is_edited_flag,
+                        audio_codec=st.session_state.get("temp_audio_codec", "wav"),
+                        original_audio=st.session_state.get("temp_audio_original")
                     )
+                    if not saved:
+                        # Keep the draft so the user can just press Upload again
+                        st.error("⚠️ Some files didn't upload. Your draft is kept, please try again.")
+                        st.stop()
                     st.toast("✅ Saved Successfully!")
                     del st.session_state.temp_summary
                     del st.session_state.temp_audio
+                    st.session_state.pop("temp_audio_original", None)
+                    if st.session_state.summary_job:
+                        summary_jobs.finish_job(st.session_state.summary_job)
+                        st.session_state.summary_job = None
+                        st.query_params.pop("job", None)
+                        st.query_params.pop("job_date", None)
                     st.session_state.step = 1
                     st.rerun()
                 except Exception as e:
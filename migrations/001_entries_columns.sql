@@ -0,0 +1,30 @@
+-- Columns the app writes to `entries` on top of the original schema.
+-- Run once in the Supabase SQL editor. Safe to run again.
+
+-- Audio is stored compressed (see modules/audio.py); old rows are WAV
+alter table entries add column if not exists audio_codec text not null default 'wav';
+-- The untouched recording, when "keep original" is on
+alter table entries add column if not exists original_audio_url text;
+-- Small WebP copy of the photo for the date grid and the feed
+alter table entries add column if not exists image_thumb_url text;
+
+-- Needed only with DIARY_DELTA_SYNC=1 (see DELTA SYNC in modules/cloud_db.py).
+-- Without it the app neither reads nor writes these two.
+alter table entries add column if not exists updated_at timestamptz not null default now();
+alter table entries add column if not exists is_deleted boolean not null default false;
+
+create or replace function entries_touch_updated_at() returns trigger as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists entries_touch_updated_at on entries;
+create trigger entries_touch_updated_at
+    before insert or update on entries
+    for each row execute function entries_touch_updated_at();
+
+create index if not exists entries_user_updated_at on entries (user_id, updated_at);
+-- Friends feed keyset pagination (date, user_id descending)
+create index if not exists entries_public_date_user on entries (date desc, user_id desc) where is_public;
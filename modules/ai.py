@@ -1,26 +1,23 @@
 import google.generativeai as genai
+import hashlib
+import heapq
+import io
+import itertools
 import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from modules import audio
 
 # Load keys once when this module is imported
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-def summarize_audio(audio_bytes):
-    """Uploads audio bytes to Gemini and returns the summary text."""
-    try:
-        # Save temp file for upload
-        temp_path = "temp_upload.wav"
-        with open(temp_path, "wb") as f:
-            f.write(audio_bytes)
-        
-        # Upload
-        myfile = genai.upload_file(temp_path)
-        
-        # Generate
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        result = model.generate_content([
-            """
+MODEL_NAME = "gemini-2.0-flash"
+
+SUMMARY_PROMPT = """
             Summarize this audio into a concise bulleted list (max 5 points).
             Style: Telegraphic, first-person diary format.
             Just output the bullet points, nothing like 'Okay, here is the summary in telegraphic, first-person diary format:' needed.
@@ -30,16 +27,361 @@ def summarize_audio(audio_bytes):
 
             Required Final Bullet:
             - A subjective 2-3 word description of the speaker's vibe (e.g., 'Sounded drunk', 'Sounded excited', 'Voice cracked').
-            """,
-            myfile
-        ])
-        
-        # Cleanup (Optional but good practice)
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-            
+            """
+
+# --- SUMMARY CACHE ---
+# Same audio + same prompt + same model = same summary, so don't pay Gemini twice.
+# The key hashes all three, so editing the prompt or switching models invalidates old entries.
+SUMMARY_CACHE_FILE = "summary_cache.sqlite"
+SUMMARY_CACHE_MAX_ENTRIES = 1000  # least recently used summaries are evicted past this
+
+_cache_lock = threading.Lock()
+_cache_conn = None
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _summary_cache():
+    """Opens the cache database (caller holds _cache_lock)."""
+    global _cache_conn
+    if _cache_conn is None:
+        _cache_conn = sqlite3.connect(SUMMARY_CACHE_FILE, check_same_thread=False)
+        _cache_conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        _cache_conn.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries(last_used)")
+        _cache_conn.commit()
+    return _cache_conn
+
+
+def summary_cache_key(audio_bytes, prompt=SUMMARY_PROMPT, model_name=MODEL_NAME):
+    h = hashlib.sha256()
+    for part in (model_name.encode(), prompt.encode()):
+        h.update(part)
+        h.update(b"\0")
+    h.update(audio_bytes)
+    return h.hexdigest()
+
+
+def _cache_lookup(key):
+    with _cache_lock:
+        conn = _summary_cache()
+        row = conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            _cache_stats["misses"] += 1
+            return None
+        conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        _cache_stats["hits"] += 1
+        return row[0]
+
+
+def _cache_store(key, summary):
+    with _cache_lock:
+        conn = _summary_cache()
+        conn.execute("INSERT OR REPLACE INTO summaries (key, summary, last_used) VALUES (?, ?, ?)",
+                     (key, summary, time.time()))
+        conn.execute("""
+            DELETE FROM summaries WHERE key NOT IN (
+                SELECT key FROM summaries ORDER BY last_used DESC LIMIT ?
+            )
+        """, (SUMMARY_CACHE_MAX_ENTRIES,))
+        conn.commit()
+
+
+def get_summary_cache_stats():
+    """Returns {"hits", "misses", "hit_rate", "size"} for the summary cache."""
+    with _cache_lock:
+        size = _summary_cache().execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        lookups = _cache_stats["hits"] + _cache_stats["misses"]
+        return {**_cache_stats, "hit_rate": _cache_stats["hits"] / lookups if lookups else 0.0, "size": size}
+
+
+# --- SCHEDULER ---
+# Every session in this process shares one token bucket (requests per minute) and one
+# concurrency cap, so a burst of users doesn't trip Gemini's rate limits. Interactive
+# requests always go ahead of batch/backfill work waiting in the same queue.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+GEMINI_RATE_PER_MINUTE = float(os.getenv("GEMINI_RATE_PER_MINUTE", "15"))
+GEMINI_BURST = 5
+GEMINI_MAX_CONCURRENT = 4
+RATE_LIMIT_RETRIES = 3  # extra attempts when Gemini still answers "429 Too Many Requests"
+
+
+class Scheduler:
+    """Token bucket + concurrency cap + priority queue. clock/sleep can be faked for tests."""
+
+    def __init__(self, rate_per_minute, burst, max_concurrent, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.clock = clock
+        self.sleep = sleep
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled_at = clock()
+        self._queue = []              # heap of (priority, sequence) tickets
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._avg_seconds = 5.0       # running average of how long a call takes
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE):
+        """Blocks until it's this caller's turn, then holds a slot for the with-block."""
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._cond.notify_all()
+        try:
+            while True:
+                with self._cond:
+                    if self._queue[0] != ticket or self._in_flight >= self.max_concurrent:
+                        self._cond.wait()
+                        continue
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        heapq.heappop(self._queue)
+                        self._in_flight += 1
+                        self._cond.notify_all()
+                        break
+                    token_wait = (1 - self._tokens) / self.rate
+                # Sleep outside the lock; anyone who jumps the queue meanwhile is re-checked after
+                self.sleep(token_wait)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                self._cond.notify_all()
+            raise
+
+        started = self.clock()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (self.clock() - started)
+                self._cond.notify_all()
+
+    def stats(self, priority=PRIORITY_INTERACTIVE):
+        """Backpressure numbers for the UI: queue depth, calls running, estimated wait for a new request."""
+        with self._cond:
+            self._refill()
+            ahead = sum(1 for p, _ in self._queue if p <= priority)
+            token_wait = max(0.0, (ahead + 1 - self._tokens) / self.rate)
+            busy = ahead + self._in_flight + 1 - self.max_concurrent
+            slot_wait = -(-busy // self.max_concurrent) * self._avg_seconds if busy > 0 else 0.0
+            return {
+                "queue_depth": len(self._queue),
+                "ahead": ahead,
+                "in_flight": self._in_flight,
+                "estimated_wait_seconds": round(max(token_wait, slot_wait), 1)
+            }
+
+
+_scheduler = Scheduler(GEMINI_RATE_PER_MINUTE, GEMINI_BURST, GEMINI_MAX_CONCURRENT)
+
+
+def configure_scheduler(rate_per_minute=None, burst=None, max_concurrent=None, clock=time.monotonic, sleep=time.sleep):
+    """Replaces the process-wide scheduler (new limits, or a simulated clock for tests)."""
+    global _scheduler
+    _scheduler = Scheduler(
+        rate_per_minute or GEMINI_RATE_PER_MINUTE, burst or GEMINI_BURST,
+        max_concurrent or GEMINI_MAX_CONCURRENT, clock=clock, sleep=sleep
+    )
+    return _scheduler
+
+
+def get_scheduler_stats(priority=PRIORITY_INTERACTIVE):
+    return _scheduler.stats(priority)
+
+
+def _is_rate_limited(error):
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in str(error)[:20]
+
+
+def _summarize_with_retry(backend, audio_bytes, codec, priority=PRIORITY_INTERACTIVE, cancel_event=None):
+    """
+    Calls the backend, backing off and retrying if the provider still says 429.
+    Every attempt waits its turn for its own token and slot; the slot is given back during
+    the backoff so other calls can use it. Returns None if cancel_event is set while waiting.
+    """
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        try:
+            with _scheduler.slot(priority):
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                return backend.summarize(audio_bytes, codec)
+        except Exception as e:
+            if not _is_rate_limited(e) or attempt == RATE_LIMIT_RETRIES:
+                raise
+            print(f"⏳ Gemini rate limited, retrying ({attempt + 1}/{RATE_LIMIT_RETRIES})")
+            _scheduler.sleep(2 ** attempt)
+
+
+# --- BACKENDS ---
+# Anything with .model_name and .summarize(audio_bytes, codec) -> str can do the summarizing.
+# Recordings under this size go inline with the request (no separate upload round trip).
+# Gemini caps a whole request at 20 MB, so bigger files use the Files API instead.
+INLINE_AUDIO_LIMIT = 15 * 1024 * 1024
+
+# GenerativeModel objects are cheap wrappers around one shared, thread-safe client,
+# so keep one per model name instead of building a new one on every call.
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _get_model(model_name):
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+
+class GeminiBackend:
+    """The real thing: sends the audio to Gemini and asks for the summary."""
+
+    def __init__(self, model_name=MODEL_NAME, prompt=SUMMARY_PROMPT):
+        self.model_name = model_name
+        self.prompt = prompt
+
+    def _contents(self, audio_bytes, codec):
+        """Builds the request without touching disk, so concurrent sessions can't collide."""
+        mime_type = audio.mime_type(codec)
+        if len(audio_bytes) <= INLINE_AUDIO_LIMIT:
+            audio_part = {"mime_type": mime_type, "data": bytes(audio_bytes)}
+        else:
+            audio_part = genai.upload_file(io.BytesIO(audio_bytes), mime_type=mime_type)
+        return [self.prompt, audio_part]
+
+    def summarize(self, audio_bytes, codec="wav"):
+        result = _get_model(self.model_name).generate_content(self._contents(audio_bytes, codec))
         return result.text
 
+    def stream(self, audio_bytes, codec="wav"):
+        """Yields pieces of the summary as Gemini generates them."""
+        response = _get_model(self.model_name).generate_content(self._contents(audio_bytes, codec), stream=True)
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackend:
+    """Local stand-in for tests and offline development. No network calls."""
+
+    def __init__(self, summary="- Fake summary\n- Sounded fine", delay=0.0, error=None,
+                 token_delay=0.0, stream_error_after=None):
+        self.model_name = "fake"
+        self.prompt = SUMMARY_PROMPT
+        self.summary = summary
+        self.delay = delay                            # before the first token / full answer
+        self.error = error
+        self.token_delay = token_delay                # between streamed tokens
+        self.stream_error_after = stream_error_after  # break the stream after N tokens
+        self.calls = 0
+
+    def summarize(self, audio_bytes, codec="wav"):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.summary
+
+    def stream(self, audio_bytes, codec="wav"):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        for i, token in enumerate(self.summary.split(" ")):
+            if self.stream_error_after is not None and i >= self.stream_error_after:
+                raise RuntimeError("Fake stream interrupted")
+            time.sleep(self.token_delay)
+            yield token if i == 0 else " " + token
+
+
+# DIARY_AI_BACKEND=fake runs the whole app without a Gemini key
+_backend = FakeBackend(delay=1.0) if os.getenv("DIARY_AI_BACKEND") == "fake" else GeminiBackend()
+
+
+def set_backend(backend):
+    """Swaps the summarization backend (e.g. ai.set_backend(ai.FakeBackend(delay=2)))."""
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    return _backend
+
+
+def summarize_audio(audio_bytes, codec="wav", priority=PRIORITY_INTERACTIVE):
+    """
+    Uploads audio bytes (WAV, or whatever `codec` they were encoded with) to Gemini and returns the summary text.
+    Waits its turn in the shared scheduler; pass priority=PRIORITY_BATCH for background work.
+    """
+    backend = _backend
+    key = summary_cache_key(audio_bytes, backend.prompt, backend.model_name)
+    cached = _cache_lookup(key)
+    if cached is not None:
+        return cached
+
+    try:
+        summary = _summarize_with_retry(backend, audio_bytes, codec, priority)
+        _cache_store(key, summary)
+        return summary
+
     except Exception as e:
         # Re-raise the error so the UI knows something went wrong
-        raise e
\ No newline at end of file
+        raise e
+
+
+def stream_summary(audio_bytes, codec="wav", cancel_event=None, priority=PRIORITY_INTERACTIVE):
+    """
+    Like summarize_audio, but yields the summary-so-far as it is generated
+    (each item is the full text up to that point, not just the new piece).
+    Set cancel_event (a threading.Event) to stop early. If streaming isn't
+    available or breaks, it falls back to the normal call and yields the full text.
+    """
+    backend = _backend
+    key = summary_cache_key(audio_bytes, backend.prompt, backend.model_name)
+    cached = _cache_lookup(key)
+    if cached is not None:
+        yield cached
+        return
+
+    if hasattr(backend, "stream"):
+        text = ""
+        try:
+            with _scheduler.slot(priority):
+                if cancel_event is not None and cancel_event.is_set():
+                    return  # cancelled while waiting in the queue
+                for piece in backend.stream(audio_bytes, codec):
+                    if cancel_event is not None and cancel_event.is_set():
+                        return  # partial text is never cached
+                    text += piece
+                    yield text
+            _cache_store(key, text)
+            return
+        except Exception as e:
+            print(f"⚠️ Streaming failed after {len(text)} chars, falling back: {e}")
+
+    if cancel_event is not None and cancel_event.is_set():
+        return
+    # The fallback is a second provider call, so it queues for a token and slot of its own
+    summary = _summarize_with_retry(backend, audio_bytes, codec, priority, cancel_event)
+    if summary is None:
+        return
+    _cache_store(key, summary)
+    yield summary
@@ -0,0 +1,213 @@
+import io
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# soundfile (libsndfile) does the encoding. Without it we just keep the WAV.
+try:
+    import soundfile as sf
+except (ImportError, OSError) as e:
+    print(f"⚠️ soundfile unavailable, recordings stay as WAV ({e})")
+    sf = None
+
+# codec -> (file extension, MIME type)
+CODECS = {
+    "wav": ("wav", "audio/wav"),
+    "flac": ("flac", "audio/flac"),
+    "opus": ("ogg", "audio/ogg"),
+}
+
+# Opus is ~10x smaller than WAV for speech; FLAC is lossless (~2x) and works at any sample rate
+DEFAULT_CODEC = os.getenv("DIARY_AUDIO_CODEC", "opus")
+# 0.0 = smallest file, 1.0 = best sound (only affects lossy codecs)
+DEFAULT_QUALITY = float(os.getenv("DIARY_AUDIO_QUALITY", "0.5"))
+
+# Silence trimming (all tunable per call too)
+SILENCE_THRESHOLD_DB = -40.0  # frames quieter than this (dB below full scale) count as silence
+SILENCE_FRAME_MS = 30         # analysis window
+SILENCE_PADDING_MS = 250      # audio kept on each side of speech so words aren't clipped
+MAX_PAUSE_MS = 1200           # pauses longer than this are shortened to this length
+
+# Encoding is CPU work; keep it off the Streamlit script thread
+_encode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="encode")
+
+
+def extension(codec):
+    return CODECS.get(codec, CODECS["wav"])[0]
+
+
+def mime_type(codec):
+    return CODECS.get(codec, CODECS["wav"])[1]
+
+
+def _encode(samples, samplerate, codec, quality):
+    buffer = io.BytesIO()
+    if codec == "opus":
+        # libsndfile's compression_level: 0 = highest bitrate, 1 = lowest
+        sf.write(buffer, samples, samplerate, format="OGG", subtype="OPUS",
+                 compression_level=1.0 - quality)
+    else:
+        sf.write(buffer, samples, samplerate, format="FLAC", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def encode_audio(wav_bytes, codec=None, quality=None):
+    """
+    Converts WAV bytes into a compact format.
+    Returns (data, codec). If the codec can't be used (e.g. Opus only supports
+    8/12/16/24/48 kHz) it falls back to FLAC, and to the original WAV as a last resort.
+    """
+    codec = codec or DEFAULT_CODEC
+    quality = DEFAULT_QUALITY if quality is None else min(max(quality, 0.0), 1.0)
+    if codec == "wav" or sf is None:
+        return wav_bytes, "wav"
+
+    try:
+        samples, samplerate = sf.read(io.BytesIO(wav_bytes), dtype="int16")
+    except Exception as e:
+        print(f"⚠️ Couldn't read recording, keeping WAV: {e}")
+        return wav_bytes, "wav"
+
+    for candidate in dict.fromkeys([codec, "flac"]):
+        try:
+            encoded = _encode(samples, samplerate, candidate, quality)
+            ratio = len(wav_bytes) / max(len(encoded), 1)
+            print(f"🗜️ Encoded recording as {candidate}: {len(wav_bytes)} -> {len(encoded)} bytes ({ratio:.1f}x)")
+            return encoded, candidate
+        except Exception as e:
+            print(f"⚠️ {candidate} encoding failed: {e}")
+
+    return wav_bytes, "wav"
+
+
+def encode_audio_async(wav_bytes, codec=None, quality=None):
+    """Same as encode_audio, but runs on a worker thread. Returns a Future of (data, codec)."""
+    return _encode_pool.submit(encode_audio, wav_bytes, codec, quality)
+
+
+def _trim_report(original_seconds, kept_seconds):
+    return {
+        "original_seconds": round(original_seconds, 2),
+        "kept_seconds": round(kept_seconds, 2),
+        "removed_seconds": round(original_seconds - kept_seconds, 2)
+    }
+
+
+def trim_silence(wav_bytes, threshold_db=None, frame_ms=None, padding_ms=None, max_pause_ms=None):
+    """
+    Cuts dead air from the start and end of a 16-bit WAV and shortens long pauses.
+    Returns (wav_bytes, report) where report is
+    {"original_seconds": 61.2, "kept_seconds": 40.5, "removed_seconds": 20.7}.
+    Anything it can't handle (other sample widths, all silence, no NumPy) is returned untouched.
+    """
+    threshold_db = SILENCE_THRESHOLD_DB if threshold_db is None else threshold_db
+    frame_ms = frame_ms or SILENCE_FRAME_MS
+    padding_ms = SILENCE_PADDING_MS if padding_ms is None else padding_ms
+    max_pause_ms = MAX_PAUSE_MS if max_pause_ms is None else max_pause_ms
+
+    try:
+        with wave.open(io.BytesIO(wav_bytes)) as w:
+            params = w.getparams()
+            frames = w.readframes(params.nframes)
+    except (wave.Error, EOFError) as e:
+        print(f"⚠️ Not a WAV we can trim: {e}")
+        return wav_bytes, _trim_report(0, 0)
+
+    original_seconds = params.nframes / params.framerate if params.framerate else 0
+    if np is None or params.sampwidth != 2 or params.nframes == 0:
+        return wav_bytes, _trim_report(original_seconds, original_seconds)
+
+    samples = np.frombuffer(frames, dtype="<i2").reshape(-1, params.nchannels)
+    mono = samples.astype(np.float32).mean(axis=1) / 32768.0
+
+    # 1. Loudness per frame (RMS in dBFS), computed in one shot over a padded 2-D view
+    frame_len = max(1, int(params.framerate * frame_ms / 1000))
+    n_frames = -(-len(mono) // frame_len)
+    padded = np.zeros(n_frames * frame_len, dtype=np.float32)
+    padded[:len(mono)] = mono
+    rms = np.sqrt(np.mean(padded.reshape(n_frames, frame_len) ** 2, axis=1))
+    voiced = 20 * np.log10(rms + 1e-10) > threshold_db
+    if not voiced.any():
+        return wav_bytes, _trim_report(original_seconds, original_seconds)
+
+    # 2. Grow speech regions by the padding so word edges survive
+    pad = int(np.ceil(padding_ms / frame_ms))
+    keep = np.convolve(voiced, np.ones(2 * pad + 1), mode="same") > 0
+    first, last = np.flatnonzero(keep)[[0, -1]]
+
+    # 3. Inside the recording, keep only the first max_pause frames of each silent run
+    silent = ~keep
+    idx = np.arange(n_frames)
+    run_start = np.maximum.accumulate(np.where(np.r_[True, silent[1:] != silent[:-1]], idx, 0))
+    keep |= silent & (idx - run_start < int(max_pause_ms / frame_ms))
+
+    # 4. Leading and trailing silence goes entirely
+    keep[:first] = False
+    keep[last + 1:] = False
+
+    sample_mask = np.repeat(keep, frame_len)[:len(samples)]
+    trimmed = samples[sample_mask]
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(params.nchannels)
+        w.setsampwidth(params.sampwidth)
+        w.setframerate(params.framerate)
+        w.writeframes(trimmed.tobytes())
+
+    report = _trim_report(original_seconds, len(trimmed) / params.framerate)
+    print(f"✂️ Trimmed {report['removed_seconds']}s of silence ({report['original_seconds']}s -> {report['kept_seconds']}s)")
+    return out.getvalue(), report
+
+
+def process_recording(wav_bytes, trim=True, codec=None, quality=None):
+    """Trims silence (optional) then encodes. Returns (data, codec, trim_report)."""
+    if trim:
+        wav_bytes, report = trim_silence(wav_bytes)
+    else:
+        report = None
+    data, codec = encode_audio(wav_bytes, codec, quality)
+    return data, codec, report
+
+
+def process_recording_async(wav_bytes, trim=True, codec=None, quality=None):
+    """Runs process_recording on a worker thread. Returns a Future."""
+    return _encode_pool.submit(process_recording, wav_bytes, trim, codec, quality)
+
+
+if __name__ == "__main__":
+    # Benchmark: python -m modules.audio [recording.wav ...]
+    # Without arguments a synthetic 60 s "speech with pauses" WAV is used.
+    import sys
+    import time
+
+    def synthetic_recording(seconds=60, rate=48000):
+        t = np.arange(seconds * rate) / rate
+        voice = 0.3 * np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+        voice += 0.02 * np.random.default_rng(0).standard_normal(len(t))
+        voice[(t % 10) > 6] = 0.0005  # 4 s of near-silence every 10 s
+        out = io.BytesIO()
+        with wave.open(out, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes((voice * 32767).astype("<i2").tobytes())
+        return out.getvalue()
+
+    if np is None:
+        sys.exit("NumPy is needed for the benchmark")
+    recordings = {path: open(path, "rb").read() for path in sys.argv[1:]} or {"synthetic 60 s": synthetic_recording()}
+    for name, wav_bytes in recordings.items():
+        print(f"{name}: {len(wav_bytes):,} bytes WAV")
+        for trim in (False, True):
+            for codec in CODECS:
+                started = time.perf_counter()
+                data, used, _ = process_recording(wav_bytes, trim=trim, codec=codec)
+                ms = (time.perf_counter() - started) * 1000
+                print(f"    {'trimmed ' if trim else ''}{codec:5} -> {used:5} {len(data):>11,} bytes "
+                      f"({len(wav_bytes) / max(len(data), 1):5.1f}x) in {ms:6.0f} ms")
@@ -1,6 +1,18 @@
+import base64
+import hashlib
+import heapq
+import json
+import mimetypes
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+import httpx
 import streamlit as st
-from supabase import create_client, Client
+from modules import audio, image_loader
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -29,66 +41,567 @@ def get_secret(key):
 SUPABASE_URL = get_secret("SUPABASE_URL")
 SUPABASE_KEY = get_secret("SUPABASE_KEY")
 
+# One keep-alive connection pool shared by every Supabase client (and the TUS uploader),
+# so new sessions reuse warm TLS connections instead of opening their own
+_http = None
+
+
+def _http_client():
+    global _http
+    if _http is None:
+        _http = httpx.Client(timeout=httpx.Timeout(60.0, connect=10.0), follow_redirects=True)
+    return _http
+
+
+def _create_client():
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=_http_client()))
+
+
 supabase: Client | None = None
 if not SUPABASE_URL or not SUPABASE_KEY:
     # This prevents the app from crashing silently if keys are missing
     print("⚠️ Error: Supabase keys are missing from .env or Secrets.")
 else:
     try:
-        # Initialize
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        # Initialize (shared by all sessions for data, storage and uploads; logins use per-session clients below)
+        supabase = _create_client()
     except Exception as e:
         print(f"❌ Supabase init error: {e}")
         supabase = None
 
-def upload_file(file_data, destination_path, bucket_name="diary_assets"):
+# --- SESSION CLIENTS ---
+# Login state lives inside a Supabase client, so each browser session gets its own,
+# created on first use. Idle ones are signed out and dropped (least recently used first).
+#
+# Data, storage and TUS traffic deliberately stays on the shared anon-key client above.
+# Tables are keyed by username and every query filters on it itself (there are no RLS
+# policies a user's JWT would unlock), friends' entries and the feed read other users'
+# rows, and the notification poller, upload pool and summary jobs run outside any
+# browser session. It also lets the entry cache and singleflight serve every session
+# from one result. Session clients only hold login state.
+SESSION_POOL_MAX = 100
+SESSION_IDLE_SECONDS = 3600
+
+_session_lock = threading.Lock()
+_session_clients = OrderedDict()  # session_key -> {"client", "last_used"}
+_session_stats = {"created": 0, "evictions": 0, "closed": 0}
+# Evicted clients are signed out here, so the request that evicted them doesn't wait on the network
+_session_close_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-close")
+
+# Override to build session clients some other way, e.g. against a local stand-in server:
+#   cloud_db.session_client_factory = lambda: create_client("http://127.0.0.1:8000", "test-key")
+session_client_factory = None
+
+
+def _new_session_client():
+    if session_client_factory is not None:
+        return session_client_factory()
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        return None
+    return _create_client()
+
+
+def _close_session_client(client):
     """
-    Uploads a file (path string OR raw bytes) to Supabase Storage.
-    Returns the Public URL.
+    Signs a dropped client out of its own session (scope "local", the user's other
+    sessions stay logged in). That also cancels its token refresh timer, which would
+    otherwise keep the client alive and refreshing forever.
+    """
+    try:
+        client.auth.sign_out({"scope": "local"})
+    except Exception as e:
+        print(f"Session Close Error: {e}")
+        timer = getattr(client.auth, "_refresh_token_timer", None)
+        if timer is not None:
+            timer.cancel()
+    with _session_lock:
+        _session_stats["closed"] += 1
+
+
+def _close_later(clients):
+    for client in clients:
+        _session_close_pool.submit(_close_session_client, client)
+
+
+def get_session_client(session_key, create=True):
+    """Returns the Supabase client for one browser session (None if unavailable)."""
+    now = time.monotonic()
+    evicted = []
+    with _session_lock:
+        while _session_clients:
+            oldest_key, oldest = next(iter(_session_clients.items()))
+            if now - oldest["last_used"] <= SESSION_IDLE_SECONDS:
+                break
+            evicted.append(_session_clients.pop(oldest_key)["client"])
+            _session_stats["evictions"] += 1
+        slot = _session_clients.get(session_key)
+        if slot is not None:
+            slot["last_used"] = now
+            _session_clients.move_to_end(session_key)
+    _close_later(evicted)
+    if slot is not None:
+        return slot["client"]
+    if not create:
+        return None
+
+    # Built outside the lock; if two requests race, the first one stored wins
+    try:
+        client = _new_session_client()
+    except Exception as e:
+        print(f"❌ Supabase session init error: {e}")
+        return None
+    if client is None:
+        return None
+    with _session_lock:
+        slot = _session_clients.get(session_key)
+        if slot is None:
+            slot = _session_clients[session_key] = {"client": client, "last_used": now}
+            _session_stats["created"] += 1
+        _session_clients.move_to_end(session_key)
+        while len(_session_clients) > SESSION_POOL_MAX:
+            evicted.append(_session_clients.popitem(last=False)[1]["client"])
+            _session_stats["evictions"] += 1
+    _close_later(evicted)
+    return slot["client"]
+
+
+def release_session(session_key):
+    """Forgets a session's client (after logout) and makes sure it is signed out."""
+    with _session_lock:
+        slot = _session_clients.pop(session_key, None)
+    if slot is not None:
+        _close_session_client(slot["client"])
+
+
+def get_session_pool_stats():
+    with _session_lock:
+        return {**_session_stats, "size": len(_session_clients)}
+
+
+# --- ENTRY CACHE ---
+# Every Streamlit rerun asks for the same entries, so keep them in memory for a while.
+# Keyed by (target_user_id, viewer_is_owner). Each key holds a "view" that can be
+# partially loaded: the set of dates that exist, some entries, or the whole history.
+# The write functions patch these views in place.
+CACHE_TTL_SECONDS = 120
+CACHE_MAX_KEYS = 256
+
+_cache_lock = threading.Lock()
+_entry_cache = OrderedDict()  # key -> {"expires_at", "dates", "entries", "complete"}
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _copy_entries(entries):
+    """Shallow copy per entry so callers can't mutate the cached dicts."""
+    return {date_key: dict(entry) for date_key, entry in entries.items()}
+
+
+def _cache_view(key, create=False):
+    """Returns the fresh view for key (caller holds _cache_lock), optionally creating it."""
+    view = _entry_cache.get(key)
+    if view is not None and view["expires_at"] < time.monotonic():
+        del _entry_cache[key]
+        view = None
+    if view is None and create:
+        view = {
+            "expires_at": time.monotonic() + CACHE_TTL_SECONDS,
+            "dates": None,      # set of dates once known
+            "entries": {},      # date -> entry, for whatever has been loaded
+            "complete": False   # True once the whole history is in "entries"
+        }
+        _entry_cache[key] = view
+        while len(_entry_cache) > CACHE_MAX_KEYS:
+            _entry_cache.popitem(last=False)
+            _cache_stats["evictions"] += 1
+    if view is not None:
+        _entry_cache.move_to_end(key)
+    return view
+
+
+def _count(hit):
+    _cache_stats["hits" if hit else "misses"] += 1
+
+
+def _cache_apply(user_id, fn):
+    """Runs fn(view, viewer_is_owner) on each cached view of user_id (write-through)."""
+    with _cache_lock:
+        for viewer_is_owner in (True, False):
+            view = _cache_view((user_id, viewer_is_owner))
+            if view is not None:
+                fn(view, viewer_is_owner)
+
+
+def _view_put(view, date_str, entry):
+    view["entries"][date_str] = entry
+    if view["dates"] is not None:
+        view["dates"].add(date_str)
+
+
+def _view_remove(view, date_str):
+    view["entries"].pop(date_str, None)
+    if view["dates"] is not None:
+        view["dates"].discard(date_str)
+
+
+def invalidate_cache(user_id=None):
+    """Drops cached entries for one user (or everyone)."""
+    with _cache_lock:
+        if user_id is None:
+            _entry_cache.clear()
+            return
+        for viewer_is_owner in (True, False):
+            _entry_cache.pop((user_id, viewer_is_owner), None)
+
+
+def get_cache_stats():
+    """Returns hit/miss counters, e.g. {"hits": 40, "misses": 2, "evictions": 0, "size": 2}."""
+    with _cache_lock:
+        return {**_cache_stats, "size": len(_entry_cache)}
+
+
+def _row_to_entry(row):
+    """Converts a Supabase row into our entry dictionary format."""
+    return {
+        "summary": row["summary"],
+        "audio_path": None,
+        "audio_url": row["audio_url"],
+        "image_path": None, # Cloud entries don't have local paths
+        "image_url": row["image_url"],
+        "image_thumb_url": row.get("image_thumb_url"),
+        "is_public": row.get("is_public", False),
+        "is_edited": row.get("is_edited", False),
+        "audio_codec": row.get("audio_codec") or "wav",
+        "original_audio_url": row.get("original_audio_url")
+    }
+
+
+# --- SINGLEFLIGHT ---
+# When several sessions ask for the same thing at the same moment (e.g. everyone opening
+# a popular friend's diary), only the first one goes to Supabase; the rest wait for it
+# and share its result.
+FLIGHT_STATS_MAX_KEYS = 256
+
+_flight_lock = threading.Lock()
+_flights = {}                 # key -> {"done": Event, "result", "error"}
+_flight_stats = OrderedDict()  # key -> {"calls", "backend_calls", "shared"}
+
+
+def _singleflight(key, fn):
+    """
+    Runs fn() once for all concurrent callers with the same key and returns its result to
+    each of them (or raises its exception). The result is shared, so callers must copy
+    before mutating.
     """
+    with _flight_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        stats = _flight_stats.pop(key, None) or {"calls": 0, "backend_calls": 0, "shared": 0}
+        _flight_stats[key] = stats
+        while len(_flight_stats) > FLIGHT_STATS_MAX_KEYS:
+            _flight_stats.popitem(last=False)
+        stats["calls"] += 1
+        stats["backend_calls" if leader else "shared"] += 1
+
+    if not leader:
+        flight["done"].wait()
+        if flight["error"] is not None:
+            raise flight["error"]
+        return flight["result"]
+
     try:
-        # Check if file_data is bytes (from memory) or string (file path)
-        if isinstance(file_data, bytes):
-            # Upload bytes directly
+        flight["result"] = fn()
+        return flight["result"]
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _flight_lock:
+            del _flights[key]
+        flight["done"].set()
+
+
+def get_singleflight_stats():
+    """Per-key counters, e.g. {("dates", "syd", False): {"calls": 12, "backend_calls": 1, "shared": 11}}."""
+    with _flight_lock:
+        return {key: dict(stats) for key, stats in _flight_stats.items()}
+
+
+# --- UPLOADS ---
+# Audio and image go up at the same time on a small shared pool.
+UPLOAD_WORKERS = 4
+UPLOAD_TIMEOUT_SECONDS = 60   # per asset, measured from when the save started
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF_SECONDS = 0.5  # doubles after each failed attempt
+
+_upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+def _upload_once(file_data, destination_path, bucket_name, content_type=None):
+    """
+    One upload attempt. Raises on failure.
+    Uses x-upsert so a retry after a half-finished attempt doesn't fail with "already exists".
+    """
+    # Check if file_data is bytes (from memory) or string (file path)
+    if isinstance(file_data, (bytes, bytearray, memoryview)):
+        # Upload bytes directly
+        supabase.storage.from_(bucket_name).upload(
+            path=destination_path,
+            file=bytes(file_data),
+            file_options={"content-type": content_type or "audio/wav", "x-upsert": "true"} # Force correct type
+        )
+    else:
+        # It's a file path (string), open and upload
+        file_options = {"x-upsert": "true"}
+        if content_type:
+            file_options["content-type"] = content_type
+        with open(file_data, 'rb') as f:
             supabase.storage.from_(bucket_name).upload(
                 path=destination_path,
-                file=file_data,
-                file_options={"content-type": "audio/wav"} # Force correct type
+                file=f,
+                file_options=file_options
             )
-        else:
-            # It's a file path (string), open and upload
-            with open(file_data, 'rb') as f:
-                supabase.storage.from_(bucket_name).upload(
-                    path=destination_path,
-                    file=f
-                )
-        
-        # Get Public URL
-        return supabase.storage.from_(bucket_name).get_public_url(destination_path)
-        
-    except Exception as e:
-        print(f"Upload Error: {e}")
-        return None
 
 
-def save_to_cloud(date_str, summary, local_audio_path, local_image_path, user_id="ryo", is_public=False, is_edited=False):
-    """Saves entry with privacy AND edit status."""
+# --- RESUMABLE UPLOADS (TUS) ---
+# Long recordings go through Supabase's resumable endpoint in fixed-size chunks, so memory
+# use doesn't grow with the file and a dropped connection resumes instead of restarting.
+RESUMABLE_CHUNK_SIZE = 6 * 1024 * 1024  # Supabase requires exactly 6 MB per chunk
+RESUMABLE_THRESHOLD = RESUMABLE_CHUNK_SIZE
+
+RESUMABLE_MAX_PENDING = 64  # interrupted uploads remembered for resuming (oldest forgotten first)
+
+_resumable_lock = threading.Lock()
+_resumable_uploads = OrderedDict()  # (bucket, destination, size, sha256) -> TUS upload URL still in progress
+
+
+def _upload_size(file_data):
+    """Size in bytes of a path, bytes-like object or seekable stream."""
+    if isinstance(file_data, (bytes, bytearray, memoryview)):
+        return memoryview(file_data).nbytes
+    if isinstance(file_data, (str, os.PathLike)):
+        return os.path.getsize(file_data)
+    position = file_data.tell()
+    size = file_data.seek(0, os.SEEK_END)
+    file_data.seek(position)
+    return size
+
+
+@contextmanager
+def _chunk_reader(file_data):
+    """Yields read(offset, size) -> bytes over a path, bytes-like object or stream, without loading it all."""
+    if isinstance(file_data, (bytes, bytearray, memoryview)):
+        view = memoryview(file_data).cast("B")
+        # Slicing a memoryview is free; only the chunk being sent gets copied
+        yield lambda offset, size: bytes(view[offset:offset + size])
+        return
+
+    def read_from(f):
+        def read(offset, size):
+            f.seek(offset)
+            return f.read(size)
+        return read
+
+    if isinstance(file_data, (str, os.PathLike)):
+        with open(file_data, "rb") as f:
+            yield read_from(f)
+    else:
+        yield read_from(file_data)
+
+
+def _content_hash(read, size):
+    """sha256 of the whole upload, so a resume never continues a different file's bytes."""
+    digest = hashlib.sha256()
+    for offset in range(0, size, RESUMABLE_CHUNK_SIZE):
+        digest.update(read(offset, RESUMABLE_CHUNK_SIZE))
+    return digest.hexdigest()
+
+
+def _remember_resumable(key, upload_url):
+    with _resumable_lock:
+        _resumable_uploads[key] = upload_url
+        _resumable_uploads.move_to_end(key)
+        while len(_resumable_uploads) > RESUMABLE_MAX_PENDING:
+            _resumable_uploads.popitem(last=False)
+
+
+def _tus_metadata(**values):
+    return ",".join(f"{k} {base64.b64encode(str(v).encode()).decode()}" for k, v in values.items())
+
+
+def upload_file_resumable(file_data, destination_path, bucket_name="diary_assets", content_type="audio/wav", retries=None):
+    """
+    Streams a file (path, bytes-like or seekable stream) to Supabase Storage in chunks.
+    If it gets interrupted, the next attempt (or the next call for the same file)
+    continues from the last chunk the server confirmed.
+    Returns the Public URL, or None if every attempt failed.
+    """
+    retries = retries or UPLOAD_RETRIES
+    endpoint = f"{SUPABASE_URL}/storage/v1/upload/resumable"
+    base_headers = {
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "apikey": SUPABASE_KEY,
+        "Tus-Resumable": "1.0.0"
+    }
+    http = _http_client()
+    size = _upload_size(file_data)
+
+    last_error = None
+    with _chunk_reader(file_data) as read:
+        # Same destination and length isn't enough: two recordings of equal duration have
+        # identical WAV sizes, and resuming one with the other's bytes would splice them
+        key = (bucket_name, destination_path, size, _content_hash(read, size))
+        for attempt in range(1, retries + 1):
+            try:
+                with _resumable_lock:
+                    upload_url = _resumable_uploads.get(key)
+                offset = 0
+                if upload_url:
+                    # Ask the server how far we got last time
+                    head = http.head(upload_url, headers=base_headers)
+                    if head.status_code in (404, 410):
+                        upload_url = None  # upload expired on the server; start over
+                    else:
+                        head.raise_for_status()
+                        offset = int(head.headers["Upload-Offset"])
+
+                if not upload_url:
+                    created = http.post(endpoint, headers={
+                        **base_headers,
+                        "Upload-Length": str(size),
+                        "Upload-Metadata": _tus_metadata(
+                            bucketName=bucket_name, objectName=destination_path,
+                            contentType=content_type, cacheControl="3600"
+                        ),
+                        "x-upsert": "true"
+                    })
+                    created.raise_for_status()
+                    upload_url = created.headers["Location"]
+                    _remember_resumable(key, upload_url)
+
+                while offset < size:
+                    response = http.patch(upload_url, content=read(offset, RESUMABLE_CHUNK_SIZE), headers={
+                        **base_headers,
+                        "Upload-Offset": str(offset),
+                        "Content-Type": "application/offset+octet-stream"
+                    })
+                    response.raise_for_status()
+                    offset = int(response.headers["Upload-Offset"])
+
+                with _resumable_lock:
+                    _resumable_uploads.pop(key, None)
+                return supabase.storage.from_(bucket_name).get_public_url(destination_path)
+
+            except Exception as e:
+                last_error = e
+                if attempt < retries:
+                    time.sleep(UPLOAD_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    print(f"Resumable Upload Error ({destination_path}, {retries} attempts, will resume next time): {last_error}")
+    return None
+
+
+def upload_file(file_data, destination_path, bucket_name="diary_assets", retries=None, content_type=None):
+    """
+    Uploads a file (path string OR raw bytes) to Supabase Storage.
+    Retries with exponential backoff. Returns the Public URL, or None if every attempt failed.
+    Anything bigger than RESUMABLE_THRESHOLD is streamed in chunks instead.
+    """
+    retries = retries or UPLOAD_RETRIES
+    if _upload_size(file_data) > RESUMABLE_THRESHOLD:
+        if not content_type and isinstance(file_data, (bytes, bytearray, memoryview)):
+            content_type = "audio/wav"
+        elif not content_type and isinstance(file_data, (str, os.PathLike)):
+            content_type = mimetypes.guess_type(str(file_data))[0]
+        return upload_file_resumable(file_data, destination_path, bucket_name,
+                                     content_type=content_type or "application/octet-stream", retries=retries)
+
+    last_error = None
+    for attempt in range(1, retries + 1):
+        try:
+            _upload_once(file_data, destination_path, bucket_name, content_type)
+            # Get Public URL
+            return supabase.storage.from_(bucket_name).get_public_url(destination_path)
+        except Exception as e:
+            last_error = e
+            if attempt < retries:
+                time.sleep(UPLOAD_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    print(f"Upload Error ({destination_path}, {retries} attempts): {last_error}")
+    return None
+
+
+def _wait_for_uploads(uploads, started_at):
+    """
+    Waits for {"audio": future, ...} and returns ({"audio": url, ...}, [failed names]).
+    Each asset gets UPLOAD_TIMEOUT_SECONDS from started_at.
+    """
+    urls, failed = {}, []
+    for name, future in uploads.items():
+        remaining = max(0, started_at + UPLOAD_TIMEOUT_SECONDS - time.monotonic())
+        try:
+            urls[name] = future.result(timeout=remaining)
+        except FutureTimeout:
+            print(f"⏱️ {name} upload timed out after {UPLOAD_TIMEOUT_SECONDS}s")
+            urls[name] = None
+        if urls[name] is None:
+            failed.append(name)
+    return urls, failed
+
+
+def save_to_cloud(date_str, summary, local_audio_path, local_image_path, user_id="ryo", is_public=False, is_edited=False,
+                  audio_codec="wav", original_audio=None):
+    """
+    Saves entry with privacy AND edit status.
+    original_audio: optional untrimmed WAV, stored next to the main recording.
+    Returns True only if the row AND every asset were saved. If any upload fails, nothing
+    is written (the caller keeps its draft and can simply call this again).
+    """
     print(f"☁️ Syncing {date_str} (Public: {is_public}, Edited: {is_edited})...")
 
     if supabase is None:
         print("❌ Supabase client not initialized; skipping cloud save.")
         return False
 
-    # 1. Upload Audio (Pass BOTH the file path AND the cloud destination)
-    audio_url = upload_file(local_audio_path, f"audio/{user_id}/{date_str}.wav")
-    
-    # 2. Upload Image
-    image_url = None
+    # 1. Start Audio + Image uploads in parallel (Pass BOTH the data AND the cloud destination)
+    started_at = time.monotonic()
+    uploads = {"audio": _upload_pool.submit(
+        upload_file, local_audio_path, f"audio/{user_id}/{date_str}.{audio.extension(audio_codec)}",
+        content_type=audio.mime_type(audio_codec)
+    )}
+    if original_audio is not None:
+        uploads["original_audio"] = _upload_pool.submit(
+            upload_file, original_audio, f"audio/{user_id}/{date_str}.original.wav", content_type="audio/wav"
+        )
     if local_image_path:
-        # Get extension (like .jpg) safely
-        ext = os.path.splitext(local_image_path)[1]
-        # Pass BOTH the file path AND the cloud destination
-        image_url = upload_file(local_image_path, f"images/{user_id}/{date_str}{ext}")
+        # Resize + re-encode while the audio is already uploading
+        try:
+            renditions = image_loader.make_upload_renditions(local_image_path)
+            uploads["image"] = _upload_pool.submit(
+                upload_file, renditions["display"], f"images/{user_id}/{date_str}_display.webp", content_type="image/webp"
+            )
+            uploads["image_thumb"] = _upload_pool.submit(
+                upload_file, renditions["thumbnail"], f"images/{user_id}/{date_str}_thumb.webp", content_type="image/webp"
+            )
+        except Exception as e:
+            # Pillow can't read it (e.g. HEIC without pillow-heif): upload the original as-is
+            print(f"⚠️ Couldn't resize {local_image_path}, uploading original: {e}")
+            ext = os.path.splitext(local_image_path)[1]
+            uploads["image"] = _upload_pool.submit(upload_file, local_image_path, f"images/{user_id}/{date_str}{ext}")
+
+    # 2. The row needs both URLs, so wait for them here
+    urls, failed_uploads = _wait_for_uploads(uploads, started_at)
+    audio_url = urls.get("audio")
+    image_url = urls.get("image")
+    print(f"⏱️ Uploads for {date_str} took {time.monotonic() - started_at:.2f}s")
+    if failed_uploads:
+        # Don't write a row with missing assets: the date would then count as saved and the
+        # user could never get back to the upload step. The caller keeps the draft and retries
+        # (uploads use x-upsert, so the ones that did succeed are simply overwritten).
+        print(f"❌ Not saving {date_str}, failed uploads: {', '.join(failed_uploads)}")
+        return False
 
     data = {
         "user_id": user_id,
@@ -96,91 +609,384 @@ def save_to_cloud(date_str, summary, local_audio_path, local_image_path, user_id
         "summary": summary,
         "audio_url": audio_url,
         "image_url": image_url,
+        "image_thumb_url": urls.get("image_thumb"),
         "is_public": is_public,
-        "is_edited": is_edited  # <--- NEW FIELD
+        "is_edited": is_edited,  # <--- NEW FIELD
+        "audio_codec": audio_codec
     }
+    if DELTA_SYNC:
+        data["is_deleted"] = False  # re-recording a deleted date brings the row back
+    if original_audio is not None:
+        data["original_audio_url"] = urls.get("original_audio")
     
     try:
         supabase.table("entries").upsert(data).execute()
-        return True
     except Exception as e:
         print(f"❌ Database Error: {e}")
         return False
 
-# --- NEW FUNCTION: Fetch Friend's Data ---
-def fetch_entries_by_user(target_user_id):
-    """Downloads all diary entries for a specific friend."""
-    try:
-        if supabase is None:
-            return {}
-        response = supabase.table("entries").select("*").eq("user_id", target_user_id).execute()
-        
-        # Convert list of rows into our dictionary format: { "2025-12-17": { ... } }
-        cloud_data = {}
-        for row in response.data:
-            date_key = row["date"]
-            cloud_data[date_key] = {
-                "summary": row["summary"],
-                "audio_path": None,      # Cloud audio isn't local
-                "audio_url": row["audio_url"], # But we have the URL!
-                "image_path": None,
-                "image_url": row["image_url"]
-            }
-        return cloud_data
-        
-    except Exception as e:
-        print(f"❌ Fetch Error: {e}")
-        return {}
-
+    # Write-through: the owner always sees it, friends only if it's public
+    def apply_save(view, viewer_is_owner):
+        if viewer_is_owner or is_public:
+            _view_put(view, date_str, _row_to_entry(data))
+        else:
+            _view_remove(view, date_str)
+    _cache_apply(user_id, apply_save)
+    return True
 
-def update_summary(date_str, user_id, new_summary):
-    """Updates only the text summary of an entry."""
+def update_summary(date_str, user_id, new_summary, is_edited=True):
+    """Updates only the text summary of an entry. (is_edited=False for machine re-summaries.)"""
     try:
         if supabase is None:
             return False
         supabase.table("entries").update({
             "summary": new_summary,
-            "is_edited": True
+            "is_edited": is_edited
         }).eq("user_id", user_id).eq("date", date_str).execute()
-        return True
     except Exception as e:
         print(f"❌ Update Error: {e}")
         return False
 
+    def apply_summary(view, viewer_is_owner):
+        if date_str in view["entries"]:
+            view["entries"][date_str].update({"summary": new_summary, "is_edited": is_edited})
+    _cache_apply(user_id, apply_summary)
+    return True
+
+def _fetch_entries_from_supabase(target_user_id, viewer_is_owner):
+    """Downloads entries straight from Supabase (raises on network errors)."""
+    query = _without_tombstones(supabase.table("entries").select("*").eq("user_id", target_user_id))
+
+    # KEY LOGIC: If I'm not the owner, force the 'is_public' filter
+    if not viewer_is_owner:
+        query = query.eq("is_public", True)
+
+    response = query.execute()
+
+    # Convert to dictionary format
+    return {row["date"]: _row_to_entry(row) for row in response.data}
+
+
+# --- DELTA SYNC ---
+# Instead of downloading the whole history, keep a copy of each user's entries on disk
+# and only ask Supabase for rows changed since the last sync (the "high-water mark").
+# Needs two extra columns on `entries`:
+#   updated_at timestamptz  (set to now() by a trigger on every insert/update)
+#   is_deleted boolean      (tombstone; deleted rows are kept so syncs can see them)
+# See migrations/001_entries_columns.sql.
+DELTA_SYNC = str(get_secret("DIARY_DELTA_SYNC") or "").lower() in ("1", "true", "yes")
+SYNC_DIR = ".sync_cache"
+
+_sync_lock = threading.Lock()
+
+
+def _without_tombstones(query):
+    """Hides soft-deleted rows. Without DELTA_SYNC the is_deleted column may not exist."""
+    return query.eq("is_deleted", False) if DELTA_SYNC else query
+
+
+def _sync_path(target_user_id, viewer_is_owner):
+    # Usernames are free text from sign-up ("../x" included), so the file name is a hash of them
+    view = "owner" if viewer_is_owner else "public"
+    name = hashlib.sha256(str(target_user_id).encode()).hexdigest()[:32]
+    return os.path.join(SYNC_DIR, f"{name}_{view}.json")
+
+
+def _load_sync_state(path):
+    if not os.path.exists(path):
+        return {"cursor": None, "entries": {}}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except ValueError:
+        print(f"⚠️ Sync cache {path} is damaged; doing a full sync.")
+        return {"cursor": None, "entries": {}}
+
+
+def _save_sync_state(path, state):
+    os.makedirs(SYNC_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def sync_entries(target_user_id, viewer_is_owner=False, client=None):
+    """
+    Brings the local copy of a user's entries up to date and returns it.
+    Only rows with updated_at >= the stored cursor are transferred.
+    `client` defaults to the Supabase client (pass a stand-in for testing).
+    """
+    client = client or supabase
+    path = _sync_path(target_user_id, viewer_is_owner)
+
+    with _sync_lock:
+        state = _load_sync_state(path)
+        cursor = state["cursor"]
+        entries = state["entries"]
+
+        def changed_rows(columns):
+            query = client.table("entries").select(columns).eq("user_id", target_user_id)
+            if cursor:
+                # >= rather than > so rows committed in the same instant aren't skipped
+                query = query.gte("updated_at", cursor)
+            return query
+
+        if viewer_is_owner:
+            rows = changed_rows("*").execute().data
+            removed = []
+        else:
+            # Friends only ever download public rows; for the rest we just need the date
+            rows = changed_rows("*").eq("is_public", True).eq("is_deleted", False).execute().data
+            removed = changed_rows("date, updated_at").or_("is_public.eq.false,is_deleted.eq.true").execute().data
+
+        for row in rows:
+            if row.get("is_deleted"):
+                entries.pop(row["date"], None)
+            else:
+                entries[row["date"]] = _row_to_entry(row)
+        for row in removed:
+            entries.pop(row["date"], None)
+
+        # Advance the high-water mark using server timestamps (never the local clock)
+        stamps = [row["updated_at"] for row in rows + removed if row.get("updated_at")]
+        if stamps:
+            state["cursor"] = max([cursor] + stamps if cursor else stamps)
+        if rows or removed or not os.path.exists(path):
+            _save_sync_state(path, state)
+
+        print(f"🔄 Synced {target_user_id}: {len(rows) + len(removed)} changed rows")
+        return _copy_entries(entries)
+
+
 def fetch_entries_by_user(target_user_id, viewer_is_owner=False):
     """
-    Downloads entries. 
+    Downloads entries (served from the cache while it is fresh).
     If viewer_is_owner is False, ONLY fetches public entries.
     """
+    key = (target_user_id, viewer_is_owner)
+    with _cache_lock:
+        view = _cache_view(key)
+        _count(view is not None and view["complete"])
+        if view is not None and view["complete"]:
+            return _copy_entries(view["entries"])
+
     try:
         if supabase is None:
             return {}
-        query = supabase.table("entries").select("*").eq("user_id", target_user_id)
-        
-        # KEY LOGIC: If I'm not the owner, force the 'is_public' filter
-        if not viewer_is_owner:
-            query = query.eq("is_public", True)
-            
-        response = query.execute()
-        
-        # Convert to dictionary format
-        cloud_data = {}
-        for row in response.data:
-            date_key = row["date"]
-            cloud_data[date_key] = {
-                "summary": row["summary"],
-                "audio_path": None,
-                "audio_url": row["audio_url"],
-                "image_path": None, # Cloud entries don't have local paths
-                "image_url": row["image_url"],
-                "is_public": row.get("is_public", False),
-                "is_edited": row.get("is_edited", False)
-            }
-        return cloud_data
-        
+        cloud_data = _singleflight(("entries",) + key, lambda: _load_complete_view(key))
     except Exception as e:
         print(f"❌ Fetch Error: {e}")
         return {}
+    return _copy_entries(cloud_data)
+
+
+def _load_complete_view(key):
+    """Downloads (or delta-syncs) a user's whole history into the cache view for key."""
+    target_user_id, viewer_is_owner = key
+    if DELTA_SYNC:
+        cloud_data = sync_entries(target_user_id, viewer_is_owner)
+    else:
+        cloud_data = _fetch_entries_from_supabase(target_user_id, viewer_is_owner)
+    with _cache_lock:
+        view = _cache_view(key, create=True)
+        view["entries"] = _copy_entries(cloud_data)
+        view["dates"] = set(cloud_data)
+        view["complete"] = True
+    return cloud_data
+
+
+def _use_synced_copy(target_user_id, viewer_is_owner):
+    """
+    With DELTA_SYNC on, the date index and single entries are served from the synced copy:
+    a new session transfers only the rows changed since the last sync. On failure the
+    callers fall back to their own small queries.
+    """
+    if not DELTA_SYNC or supabase is None:
+        return
+    key = (target_user_id, viewer_is_owner)
+    with _cache_lock:
+        view = _cache_view(key)
+        if view is not None and view["complete"]:
+            return
+    try:
+        _singleflight(("entries",) + key, lambda: _load_complete_view(key))
+    except Exception as e:
+        print(f"❌ Sync Error: {e}")
+
+
+# --- DATE-WINDOW QUERIES ---
+# The UI only needs to know which dates exist, plus the full entry for the date on screen.
+# These keep payloads small no matter how old the diary is.
+ENTRY_COLUMNS = "date, summary, audio_url, audio_codec, original_audio_url, image_url, image_thumb_url, is_public, is_edited"
+
+
+def _entries_query(columns, target_user_id, viewer_is_owner):
+    # Soft-deleted rows (is_deleted tombstones, see DELTA SYNC) are only for sync_entries
+    query = _without_tombstones(supabase.table("entries").select(columns).eq("user_id", target_user_id))
+    if not viewer_is_owner:
+        query = query.eq("is_public", True)
+    return query
+
+
+def fetch_entry_dates(target_user_id, viewer_is_owner=False):
+    """Returns the set of dates that have an entry, fetching only the `date` column."""
+    _use_synced_copy(target_user_id, viewer_is_owner)
+    key = (target_user_id, viewer_is_owner)
+    with _cache_lock:
+        view = _cache_view(key)
+        _count(view is not None and view["dates"] is not None)
+        if view is not None and view["dates"] is not None:
+            return set(view["dates"])
+
+    try:
+        if supabase is None:
+            return set()
+        dates = _singleflight(
+            ("dates",) + key,
+            lambda: {row["date"] for row in _entries_query("date", target_user_id, viewer_is_owner).execute().data}
+        )
+    except Exception as e:
+        print(f"❌ Date Index Error: {e}")
+        return set()
+
+    with _cache_lock:
+        _cache_view(key, create=True)["dates"] = set(dates)
+    return set(dates)
+
+
+def fetch_entry(target_user_id, date_str, viewer_is_owner=False):
+    """Lazily loads the full entry for one date. Returns None if there isn't one."""
+    _use_synced_copy(target_user_id, viewer_is_owner)
+    key = (target_user_id, viewer_is_owner)
+    with _cache_lock:
+        view = _cache_view(key)
+        if view is not None:
+            if date_str in view["entries"]:
+                _count(True)
+                return dict(view["entries"][date_str])
+            known_dates = view["entries"] if view["complete"] else view["dates"]
+            if known_dates is not None and date_str not in known_dates:
+                _count(True)
+                return None
+        _count(False)
+
+    try:
+        if supabase is None:
+            return None
+        response = _singleflight(
+            ("entry", target_user_id, date_str, viewer_is_owner),
+            lambda: _entries_query(ENTRY_COLUMNS, target_user_id, viewer_is_owner).eq("date", date_str).limit(1).execute()
+        )
+    except Exception as e:
+        print(f"❌ Fetch Error: {e}")
+        return None
+
+    if not response.data:
+        return None
+    entry = _row_to_entry(response.data[0])
+    with _cache_lock:
+        _view_put(_cache_view(key, create=True), date_str, dict(entry))
+    return entry
+
+
+def fetch_entries_in_range(target_user_id, start_date=None, end_date=None, viewer_is_owner=False):
+    """
+    Downloads entries with start_date <= date <= end_date (dates as 'YYYY-MM-DD'; None = open-ended).
+    Used by batch jobs, so unlike the page loaders it raises on errors instead of
+    returning {}: an outage must not look like an empty range.
+    """
+    start_date = str(start_date) if start_date else None
+    end_date = str(end_date) if end_date else None
+
+    def in_range(date_str):
+        return (start_date is None or start_date <= date_str) and (end_date is None or date_str <= end_date)
+
+    key = (target_user_id, viewer_is_owner)
+    with _cache_lock:
+        view = _cache_view(key)
+        _count(view is not None and view["complete"])
+        if view is not None and view["complete"]:
+            return {d: dict(e) for d, e in view["entries"].items() if in_range(d)}
+
+    if supabase is None:
+        raise RuntimeError("Supabase is not configured")
+    query = _entries_query(ENTRY_COLUMNS, target_user_id, viewer_is_owner)
+    if start_date:
+        query = query.gte("date", start_date)
+    if end_date:
+        query = query.lte("date", end_date)
+    response = query.order("date").execute()
+
+    cloud_data = {row["date"]: _row_to_entry(row) for row in response.data}
+    with _cache_lock:
+        view = _cache_view(key, create=True)
+        for date_key, entry in cloud_data.items():
+            _view_put(view, date_key, dict(entry))
+    return cloud_data
+
+
+def search_entries(target_user_id, search_term, viewer_is_owner=False, limit=50):
+    """Server-side keyword search. Returns matching dates, newest first."""
+    try:
+        if supabase is None:
+            return []
+        # Escape LIKE wildcards so the term is matched literally
+        term = search_term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        response = _entries_query("date", target_user_id, viewer_is_owner)\
+            .ilike("summary", f"%{term}%").order("date", desc=True).limit(limit).execute()
+        return [row["date"] for row in response.data]
+    except Exception as e:
+        print(f"❌ Search Error: {e}")
+        return []
+
+# --- FRIENDS FEED ---
+# Everyone's public entries, newest first, one page at a time. Friends are queried in
+# groups (so the `in` filter stays a sane URL length); each group is already date-ordered,
+# and the groups are merged lazily.
+FEED_PAGE_SIZE = 20
+FEED_USERS_PER_QUERY = 100
+
+
+def _feed_stream(user_ids, cursor, limit):
+    """One group's next page, newest first, ordered by (date, user_id) descending."""
+    query = _without_tombstones(supabase.table("entries").select(f"user_id, {ENTRY_COLUMNS}")
+                                .in_("user_id", user_ids).eq("is_public", True))
+    if cursor:
+        # Keyset pagination: strictly after the last (date, user_id) we showed
+        date_str, user_id = cursor
+        query = query.or_(f"date.lt.{date_str},and(date.eq.{date_str},user_id.lt.{user_id})")
+    response = query.order("date", desc=True).order("user_id", desc=True).limit(limit).execute()
+    for row in response.data:
+        yield row["user_id"], row["date"], _row_to_entry(row)
+
+
+def fetch_feed_page(friends, cursor=None, limit=FEED_PAGE_SIZE):
+    """
+    Returns (items, next_cursor) for the friends feed.
+    items is [(user_id, date, entry), ...] newest first; pass next_cursor back to get the
+    following page. next_cursor is None when there is nothing more.
+    """
+    friends = sorted(set(friends))
+    if not friends or supabase is None:
+        return [], None
+    try:
+        groups = [friends[i:i + FEED_USERS_PER_QUERY] for i in range(0, len(friends), FEED_USERS_PER_QUERY)]
+        streams = [_feed_stream(group, cursor, limit) for group in groups]
+        merged = heapq.merge(*streams, key=lambda item: (item[1], item[0]), reverse=True)
+        items = [item for item, _ in zip(merged, range(limit))]
+    except Exception as e:
+        print(f"❌ Feed Error: {e}")
+        return [], cursor
+
+    # Seed the per-friend cache so opening one of these entries doesn't refetch it
+    with _cache_lock:
+        for user_id, date_str, entry in items:
+            _view_put(_cache_view((user_id, False), create=True), date_str, dict(entry))
+
+    next_cursor = (items[-1][1], items[-1][0]) if len(items) == limit else None
+    return items, next_cursor
+
 
 def update_privacy(date_str, user_id, is_public):
     """Updates just the privacy setting."""
@@ -190,11 +996,27 @@ def update_privacy(date_str, user_id, is_public):
         supabase.table("entries").update({
             "is_public": is_public
         }).eq("user_id", user_id).eq("date", date_str).execute()
-        return True
     except Exception as e:
         print(f"❌ Privacy Update Error: {e}")
         return False
 
+    # The owner's view knows the full entry, so use it to add/remove it from the public view
+    with _cache_lock:
+        owner_view = _cache_view((user_id, True))
+        public_view = _cache_view((user_id, False))
+        owner_entry = owner_view["entries"].get(date_str) if owner_view else None
+        if owner_entry is not None:
+            owner_entry["is_public"] = is_public
+        if public_view is not None:
+            if is_public and owner_entry is not None:
+                _view_put(public_view, date_str, dict(owner_entry))
+            elif is_public:
+                # We don't know the rest of the entry; refetch the public view next time
+                _entry_cache.pop((user_id, False), None)
+            else:
+                _view_remove(public_view, date_str)
+    return True
+
 
 def check_login(username, password):
     """Verifies username and password against Supabase."""
@@ -227,9 +1049,11 @@ def sign_up(username, password):
     email = f"{username}@{DUMMY_DOMAIN}"
     
     try:
-        if supabase is None:
+        # A throwaway client, so signing up never changes anyone's login state
+        client = _new_session_client()
+        if client is None:
             return False
-        response = supabase.auth.sign_up({
+        response = client.auth.sign_up({
             "email": email,
             "password": password,
             "options": {
@@ -246,17 +1070,19 @@ def sign_up(username, password):
         print(f"Sign Up Error: {e}")
         return False
 
-def login(username, password):
+def login(username, password, session_key):
     """
     Logs in using ONLY username and password.
+    The login is kept on this browser session's own client (see get_session_client).
     """
     # 1. Reconstruct the 'fake' email
     email = f"{username}@{DUMMY_DOMAIN}"
     
     try:
-        if supabase is None:
+        client = get_session_client(session_key)
+        if client is None:
             return None
-        response = supabase.auth.sign_in_with_password({
+        response = client.auth.sign_in_with_password({
             "email": email,
             "password": password
         })
@@ -267,14 +1093,16 @@ def login(username, password):
         # Don't print the error to user, just return None
         return None
 
-def get_current_user():
+def get_current_user(session_key):
     """
-    Checks if there is a valid session locally (in the Supabase client).
+    Checks if there is a valid session locally (in this browser session's Supabase client).
     Returns the username if logged in, None otherwise.
     """
-    if supabase is None:
+    # Don't build a client just to find out nobody is logged in
+    client = get_session_client(session_key, create=False)
+    if client is None:
         return None
-    session = supabase.auth.get_session()
+    session = client.auth.get_session()
     if session:
         # If the token is valid, get the metadata (username)
         return session.user.user_metadata.get("username")
@@ -282,6 +1110,67 @@ def get_current_user():
 
 
 
+# --- FRIEND GRAPH ---
+# Both friend lists and pending requests come from one query and are kept in memory per user.
+# Our own writes update it immediately; other people's changes show up within the TTL.
+FRIEND_CACHE_TTL_SECONDS = 60
+
+_friend_lock = threading.Lock()
+_friend_cache = {}  # username -> {"expires_at", "friends": set, "pending": {request_id: row}}
+
+# Notifications don't need to hold up the button that triggered them
+_notify_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="notify")
+
+
+def _friend_graph(username):
+    """Returns the cached graph for username, loading it with a single query when stale."""
+    with _friend_lock:
+        graph = _friend_cache.get(username)
+        if graph is not None and graph["expires_at"] >= time.monotonic():
+            return graph
+
+    return _singleflight(("friends", username), lambda: _load_friend_graph(username))
+
+
+def _load_friend_graph(username):
+    res = supabase.table("friends").select("id, sender, receiver, status")\
+        .or_(f"sender.eq.{username},receiver.eq.{username}").execute()
+
+    graph = {"expires_at": time.monotonic() + FRIEND_CACHE_TTL_SECONDS, "friends": set(), "pending": {}}
+    for row in res.data:
+        if row["status"] == "accepted":
+            # If I was the sender, the friend is the receiver (and vice versa)
+            graph["friends"].add(row["receiver"] if row["sender"] == username else row["sender"])
+        elif row["status"] == "pending" and row["receiver"] == username:
+            graph["pending"][row["id"]] = row
+    with _friend_lock:
+        _friend_cache[username] = graph
+    return graph
+
+
+def _apply_friend_row(row):
+    """Applies an inserted/updated friends row to whichever cached graphs it touches."""
+    with _friend_lock:
+        for username in (row["sender"], row["receiver"]):
+            graph = _friend_cache.get(username)
+            if graph is None:
+                continue
+            if row["status"] == "accepted":
+                graph["friends"].add(row["receiver"] if row["sender"] == username else row["sender"])
+                graph["pending"].pop(row["id"], None)
+            elif row["status"] == "pending" and row["receiver"] == username:
+                graph["pending"][row["id"]] = row
+
+
+def invalidate_friends(username=None):
+    """Drops the cached friend graph for one user (or everyone)."""
+    with _friend_lock:
+        if username is None:
+            _friend_cache.clear()
+        else:
+            _friend_cache.pop(username, None)
+
+
 def get_pending_requests(username):
     """
     Returns list of people waiting for YOU to accept.
@@ -289,8 +1178,9 @@ def get_pending_requests(username):
     try:
         if supabase is None:
             return []
-        res = supabase.table("friends").select("*").eq("receiver", username).eq("status", "pending").execute()
-        return res.data
+        graph = _friend_graph(username)
+        with _friend_lock:
+            return [dict(row) for row in graph["pending"].values()]
     except:
         return []
 
@@ -303,30 +1193,25 @@ def get_my_friends(username):
     try:
         if supabase is None:
             return []
-        # Find rows where I am sender OR receiver, AND status is accepted
-        res = supabase.table("friends").select("*").or_(f"sender.eq.{username},receiver.eq.{username}").eq("status", "accepted").execute()
-        
-        friends = []
-        for row in res.data:
-            # If I was the sender, the friend is the receiver (and vice versa)
-            if row["sender"] == username:
-                friends.append(row["receiver"])
-            else:
-                friends.append(row["sender"])
-        return friends
+        graph = _friend_graph(username)
+        with _friend_lock:
+            return sorted(graph["friends"])
     except:
         return []
 
-def logout():
+def logout(session_key):
     """
     Destroys the Supabase session so auto-login doesn't trigger again.
     """
     try:
-        if supabase is None:
+        client = get_session_client(session_key, create=False)
+        if client is None:
             return
-        supabase.auth.sign_out()
+        client.auth.sign_out()
     except Exception as e:
         print(f"Logout Error: {e}")
+    finally:
+        release_session(session_key)
 
 # 1. NEW: Generic Notification Function
 def add_notification(target_user, message):
@@ -369,15 +1254,17 @@ def send_friend_request(from_user, to_user):
     try:
         if supabase is None:
             return False, "Supabase not configured."
-        # A. Create the Friend Request
-        supabase.table("friends").insert({
+        # A. Create the Friend Request (the inserted row comes back, so no extra read)
+        res = supabase.table("friends").insert({
             "sender": from_user,
             "receiver": to_user,
             "status": "pending"
         }).execute()
+        if res.data:
+            _apply_friend_row(res.data[0])
         
-        # B. Notify the Receiver
-        add_notification(to_user, f"👋 New friend request from {from_user}!")
+        # B. Notify the Receiver (in the background)
+        _notify_pool.submit(add_notification, to_user, f"👋 New friend request from {from_user}!")
         
         return True, "Request sent!"
     except Exception as e:
@@ -386,27 +1273,23 @@ def send_friend_request(from_user, to_user):
 # 4. UPDATE: Accept Friend (Now sends notification!)
 def accept_friend(request_id):
     try:
-        # A. Look up the request row so we know who to notify
-        select_res = (
-            supabase
-            .table("friends")
-            .select("*")
-            .eq("id", request_id)
-            .execute()
-        )
+        if supabase is None:
+            return False
+        # A. Update status to accepted. The updated row comes back, telling us who to notify
+        res = supabase.table("friends").update({"status": "accepted"}).eq("id", request_id).execute()
 
-        if not select_res.data:
-            return
+        if not res.data:
+            return False
 
-        friend_row = select_res.data[0]
+        friend_row = res.data[0]
         sender_name = friend_row["sender"]
         receiver_name = friend_row["receiver"]
+        _apply_friend_row(friend_row)
 
-        # B. Update status to accepted
-        supabase.table("friends").update({"status": "accepted"}).eq("id", request_id).execute()
-
-        # C. Notify the sender
-        add_notification(sender_name, f"✅ {receiver_name} accepted your friend request!")
+        # B. Notify the sender (in the background)
+        _notify_pool.submit(add_notification, sender_name, f"✅ {receiver_name} accepted your friend request!")
+        return True
 
     except Exception as e:
-        print(f"Accept Error: {e}")
\ No newline at end of file
+        print(f"Accept Error: {e}")
+        return False
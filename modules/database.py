@@ -1,66 +1,293 @@
 import json
 import os
 import shutil
+import threading
+from modules import audio, sqlite_db
 
-DB_FILE = "diary_db.json"
+DB_FILE = "diary_db.json"          # Compacted snapshot (same format as before)
+JOURNAL_FILE = "diary_db.journal"  # Append-only log of edits since the snapshot
+ROTATED_JOURNAL_FILE = "diary_db.journal.old"  # Being folded into the snapshot by compact()
 AUDIO_DIR = "recordings"
 IMAGE_DIR = "image_path"
 
+# "json" (journal + snapshot, the default) or "sqlite" (adds ranked full-text search)
+BACKEND = os.getenv("DIARY_DB_BACKEND", "json").lower()
+
+# Fold the journal into a fresh snapshot after this many appended edits
+COMPACT_EVERY = 500
+
 # Ensure audio directory exists when this module is imported
 if not os.path.exists(AUDIO_DIR):
     os.makedirs(AUDIO_DIR)
-if not os.path.exists(IMAGE_DIR):   
+if not os.path.exists(IMAGE_DIR):
     os.makedirs(IMAGE_DIR)
 
+# In-memory index, rebuilt from snapshot + journal the first time it is needed
+_lock = threading.RLock()
+_index = None
+_journal = None
+_journal_records = 0
+_compacting = False
+
+
+def _fsync_dir(path):
+    """Makes a rename inside `path` durable (no-op where unsupported)."""
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _atomic_write_json(path, data):
+    """Writes JSON to a temp file, fsyncs it, then swaps it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path))
+
+
+def _apply(db, record):
+    """Applies one journal record to the index dictionary."""
+    date_str = record.get("date")
+    if record.get("op") == "put":
+        db[date_str] = record["entry"]
+    elif record.get("op") == "patch" and date_str in db:
+        db[date_str].update(record["fields"])
+
+
+def _replay(db, path):
+    """Applies every complete record in a journal file to db. Returns how many were applied."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # A crash mid-append leaves a torn last line. Cut it off so the next
+            # append starts on a fresh line instead of being glued onto it.
+            print(f"⚠️ Dropping damaged journal tail in {path}")
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+    records = 0
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            print(f"⚠️ Skipping damaged journal record in {path}")
+            continue
+        _apply(db, record)
+        records += 1
+    return records
+
+
+def _open_store():
+    """Loads the snapshot and replays the journal on top of it (once)."""
+    global _index, _journal, _journal_records
+    if _index is not None:
+        return _index
+
+    db = {}
+    if os.path.exists(DB_FILE):
+        with open(DB_FILE, "r") as f:
+            db = json.load(f)
+
+    # A rotated journal means compaction was interrupted: its edits may not be in the snapshot yet
+    _replay(db, ROTATED_JOURNAL_FILE)
+    records = _replay(db, JOURNAL_FILE)
+    if os.path.exists(ROTATED_JOURNAL_FILE):
+        _atomic_write_json(DB_FILE, db)
+        os.remove(ROTATED_JOURNAL_FILE)
+
+    _index = db
+    _journal = open(JOURNAL_FILE, "a")
+    _journal_records = records
+    return _index
+
+
+def _append(record):
+    """Durably appends one record to the journal, then applies it in memory."""
+    global _journal_records
+    with _lock:
+        db = _open_store()
+        _journal.write(json.dumps(record) + "\n")
+        _journal.flush()
+        os.fsync(_journal.fileno())
+        _apply(db, record)
+        _journal_records += 1
+
+        if _journal_records >= COMPACT_EVERY:
+            _start_compaction()
+
+
+def _start_compaction():
+    """Kicks off compaction on a background thread (at most one at a time)."""
+    global _compacting
+    if _compacting:
+        return
+    _compacting = True
+    threading.Thread(target=compact, daemon=True).start()
+
+
+def compact():
+    """Writes the current index as a new snapshot and empties the journal."""
+    global _journal, _journal_records, _compacting
+    try:
+        with _lock:
+            # Only the copy and the journal swap block writers; the slow dump happens below
+            snapshot = {date_str: dict(entry) for date_str, entry in _open_store().items()}
+            _journal.close()
+            os.replace(JOURNAL_FILE, ROTATED_JOURNAL_FILE)
+            _journal = open(JOURNAL_FILE, "w")
+            os.fsync(_journal.fileno())
+            _fsync_dir(os.path.dirname(JOURNAL_FILE))
+            _journal_records = 0
+
+        # The snapshot now contains every rotated edit, so the rotated log can go.
+        # (If we crash before this, _open_store replays it and finishes the job.)
+        _atomic_write_json(DB_FILE, snapshot)
+        os.remove(ROTATED_JOURNAL_FILE)
+    except Exception as e:
+        print(f"❌ Compaction Error: {e}")
+    finally:
+        _compacting = False
+
+
 def load_db():
     """Loads the database (JSON) into a Python Dictionary."""
-    if not os.path.exists(DB_FILE):
-        return {}
-    with open(DB_FILE, "r") as f:
-        return json.load(f)
-
-def save_entry(date_str, summary, audio_bytes, image_path, is_edited=False, is_public=False):
-    """Saves entry locally with is_edited AND is_public flags."""
-    
+    if BACKEND == "sqlite":
+        return sqlite_db.load_db()
+    with _lock:
+        db = _open_store()
+        # Hand out copies so callers can't mutate the index behind the journal's back
+        return {date_str: dict(entry) for date_str, entry in db.items()}
+
+def save_entry(date_str, summary, audio_bytes, image_path, is_edited=False, is_public=False, audio_codec="wav",
+               original_audio_bytes=None):
+    """
+    Saves entry locally with is_edited AND is_public flags.
+    original_audio_bytes: optional untrimmed WAV, kept as recordings/{date}.original.wav
+    """
+
     # 1. Save Audio File
-    local_audio_path = f"recordings/{date_str}.wav"
+    local_audio_path = f"recordings/{date_str}.{audio.extension(audio_codec)}"
     if not os.path.exists("recordings"):
         os.makedirs("recordings")
-        
+
     with open(local_audio_path, "wb") as f:
         f.write(audio_bytes)
-    
-    # 2. Update Local Database
-    db = load_db()
-    db[date_str] = {
+
+    original_audio_path = None
+    if original_audio_bytes is not None:
+        original_audio_path = f"recordings/{date_str}.original.wav"
+        with open(original_audio_path, "wb") as f:
+            f.write(original_audio_bytes)
+
+    entry = {
         "summary": summary,
         "audio_path": local_audio_path,
         "image_path": image_path,
         "image_url": None,
         "is_edited": is_edited,
-        "is_public": is_public  # <--- NOW SAVING THIS
+        "is_public": is_public,  # <--- NOW SAVING THIS
+        "audio_codec": audio_codec,
+        "original_audio_path": original_audio_path
     }
-    
-    with open(DB_FILE, "w") as f:
-        json.dump(db, f, indent=4)
 
-def update_local_text(date_str, new_text):
-    """Updates the text summary in the local JSON file."""
-    db = load_db() # Load current data
-    
-    if date_str in db:
-        # Update the specific fields
-        db[date_str]["summary"] = new_text
-        db[date_str]["is_edited"] = True
-        
-        # Save back to disk (using the same logic as save_entry)
-        with open(DB_FILE, "w") as f:
-            json.dump(db, f, indent=4)
+    # 2. Update Local Database
+    if BACKEND == "sqlite":
+        sqlite_db.upsert_entry(date_str, entry)
+    else:
+        _append({"op": "put", "date": date_str, "entry": entry})
+
+def update_local_text(date_str, new_text, is_edited=True):
+    """Updates the text summary in the local JSON file. (is_edited=False for machine re-summaries.)"""
+    if BACKEND == "sqlite":
+        sqlite_db.update_fields(date_str, summary=new_text, is_edited=is_edited)
+        return
+    with _lock:
+        if date_str in _open_store():
+            # Only the changed fields go to disk
+            _append({
+                "op": "patch",
+                "date": date_str,
+                "fields": {"summary": new_text, "is_edited": is_edited}
+            })
 
 def update_local_privacy(date_str, is_public):
     """Updates just the privacy setting locally."""
-    db = load_db()
-    if date_str in db:
-        db[date_str]["is_public"] = is_public
+    if BACKEND == "sqlite":
+        sqlite_db.update_fields(date_str, is_public=is_public)
+        return
+    with _lock:
+        if date_str in _open_store():
+            _append({
+                "op": "patch",
+                "date": date_str,
+                "fields": {"is_public": is_public}
+            })
+
+def search_entries(search_term, limit=20):
+    """
+    Searches local summaries.
+    Returns [{"date": ..., "snippet": ...}], ranked when the SQLite backend is on.
+    """
+    if BACKEND == "sqlite":
+        return sqlite_db.search(search_term, limit=limit)
+
+    term = search_term.lower()
+    results = [
+        {"date": date_str, "snippet": entry["summary"]}
+        for date_str, entry in load_db().items()
+        if term in (entry.get("summary") or "").lower()
+    ]
+    return results[:limit]
+
+
+if __name__ == "__main__":
+    # Benchmark: python -m modules.database [entries]
+    import sys
+    import tempfile
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    os.chdir(tempfile.mkdtemp(prefix="diary_db_bench_"))
+    os.makedirs(AUDIO_DIR)
+    db = {f"{i:05d}": {"summary": f"entry {i}", "audio_path": None, "image_path": None, "image_url": None,
+                       "is_edited": False, "is_public": False} for i in range(n)}
+    with open(DB_FILE, "w") as f:
+        json.dump(db, f, indent=4)
+
+    # The old way: load, change one entry, rewrite the whole file
+    started = time.perf_counter()
+    for i in range(20):
+        with open(DB_FILE, "r") as f:
+            data = json.load(f)
+        data[f"{i:05d}"]["summary"] = "edited"
         with open(DB_FILE, "w") as f:
-            json.dump(db, f, indent=4)
\ No newline at end of file
+            json.dump(data, f, indent=4)
+    rewrite_ms = (time.perf_counter() - started) / 20 * 1000
+
+    _open_store()
+    started = time.perf_counter()
+    edits = 200
+    for i in range(edits):
+        update_local_text(f"{i % n:05d}", f"edited {i}")
+    journal_ms = (time.perf_counter() - started) / edits * 1000
+
+    started = time.perf_counter()
+    compact()
+    compact_ms = (time.perf_counter() - started) * 1000
+
+    print(f"{n} entries: full rewrite {rewrite_ms:.1f} ms/edit | journal append {journal_ms:.2f} ms/edit "
+          f"(fsync'd) | compaction {compact_ms:.0f} ms")
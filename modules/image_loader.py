@@ -1,22 +1,271 @@
 from PIL import Image, ImageOps
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import io
+import multiprocessing
 import os
+import threading
+import time
 
-def load_image_for_streamlit(image_path):
+# HEIC support (iPhone originals) if pillow-heif is installed
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+# Longest edge (px) of each rendition we keep on disk
+RENDITION_SIZES = {
+    "thumbnail": 320,   # suggestion grid, step 2 preview
+    "preview": 800,
+    "display": 1600,    # the photo on the view page
+}
+RENDITION_CACHE_DIR = ".image_cache"
+RENDITION_CACHE_MAX_BYTES = 300 * 1024 * 1024  # oldest renditions are evicted past this
+
+_cache_lock = threading.Lock()
+_cache_bytes = None  # running total, computed from disk on first use
+_stats = {"hits": 0, "misses": 0, "hit_ms": 0.0, "miss_ms": 0.0,
+          "original_pixels": 0, "served_pixels": 0}
+
+
+def _rendition_path(image_path, size_name):
+    """Cache file for (path, mtime, size). Editing or replacing the photo changes the key."""
+    st = os.stat(image_path)
+    raw = f"{os.path.abspath(image_path)}|{st.st_mtime_ns}|{st.st_size}|{RENDITION_SIZES[size_name]}"
+    return os.path.join(RENDITION_CACHE_DIR, hashlib.sha1(raw.encode()).hexdigest())
+
+
+def _make_rendition(image_path, max_edge):
+    """Decodes only as much of the original as needed, then orients and shrinks it."""
+    image = Image.open(image_path)
+    original_pixels = image.width * image.height
+
+    # JPEG fast path: let the decoder downscale by 1/2, 1/4 or 1/8 while decoding
+    image.draft("RGB", (max_edge, max_edge))
+
+    # fix orientation (iPhone photos often appear rotated otherwise)
+    image = ImageOps.exif_transpose(image)
+
+    # Cheap integer box-reduce first, then a quality resize for the last step
+    factor = min(image.width, image.height) // (max_edge * 2)
+    if factor >= 2:
+        image = image.reduce(factor)
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return image, original_pixels
+
+
+def _evict_if_needed(added_bytes):
+    """Keeps the cache folder under RENDITION_CACHE_MAX_BYTES (least recently used first)."""
+    global _cache_bytes
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(e.stat().st_size for e in os.scandir(RENDITION_CACHE_DIR) if e.is_file())
+        else:
+            _cache_bytes += added_bytes
+        if _cache_bytes <= RENDITION_CACHE_MAX_BYTES:
+            return
+
+        files = sorted((e for e in os.scandir(RENDITION_CACHE_DIR) if e.is_file()),
+                       key=lambda e: e.stat().st_mtime)
+        for entry in files:
+            if _cache_bytes <= RENDITION_CACHE_MAX_BYTES * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                _cache_bytes -= size
+            except OSError:
+                pass
+
+
+def _find_cached(base_path):
+    for ext in (".jpg", ".png"):
+        if os.path.exists(base_path + ext):
+            os.utime(base_path + ext)  # mark as recently used for eviction
+            return base_path + ext
+    return None
+
+
+def _render(image_path, size_name):
+    """
+    Finds or creates the rendition and returns (path or None, timings).
+    Also runs in worker processes, so it leaves _stats and eviction to the caller (_record).
+    """
+    if not image_path or not os.path.exists(image_path):
+        return None, None
+
+    started = time.perf_counter()
+    max_edge = RENDITION_SIZES[size_name]
+    base_path = _rendition_path(image_path, size_name)
+    cached = _find_cached(base_path)
+    if cached:
+        return cached, {"hit": True, "ms": (time.perf_counter() - started) * 1000}
+
+    try:
+        image, original_pixels = _make_rendition(image_path, max_edge)
+    except Exception as e:
+        print(f"Error loading image {image_path}: {e}")
+        return None, None
+
+    # Keep transparency (PNG); everything else becomes a small JPEG
+    os.makedirs(RENDITION_CACHE_DIR, exist_ok=True)
+    has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+    path = base_path + (".png" if has_alpha else ".jpg")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if has_alpha:
+        image.save(tmp_path, format="PNG", optimize=True)
+    else:
+        image.convert("RGB").save(tmp_path, format="JPEG", quality=85, optimize=True)
+    os.replace(tmp_path, path)
+
+    return path, {"hit": False, "ms": (time.perf_counter() - started) * 1000,
+                  "original_pixels": original_pixels, "served_pixels": image.width * image.height,
+                  "bytes": os.path.getsize(path)}
+
+
+def _record(timings):
+    """Adds one _render result to _stats and keeps the cache folder within its budget."""
+    if timings is None:
+        return
+    if timings["hit"]:
+        _stats["hits"] += 1
+        _stats["hit_ms"] += timings["ms"]
+        return
+    _stats["misses"] += 1
+    _stats["miss_ms"] += timings["ms"]
+    _stats["original_pixels"] += timings["original_pixels"]
+    _stats["served_pixels"] += timings["served_pixels"]
+    _evict_if_needed(timings["bytes"])
+
+
+def get_rendition(image_path, size_name="display"):
+    """
+    Returns the path of a cached, pre-oriented, downsized copy of image_path,
+    creating it on first use. Returns None if the original can't be read.
+    """
+    path, timings = _render(image_path, size_name)
+    _record(timings)
+    return path
+
+
+def get_rendition_stats():
+    """Hit/miss counts, average latency, and how many fewer pixels we decode vs the originals."""
+    hits, misses = _stats["hits"], _stats["misses"]
+    return {
+        "hits": hits,
+        "misses": misses,
+        "avg_hit_ms": round(_stats["hit_ms"] / hits, 2) if hits else 0.0,
+        "avg_miss_ms": round(_stats["miss_ms"] / misses, 2) if misses else 0.0,
+        "pixel_reduction": round(_stats["original_pixels"] / _stats["served_pixels"], 1) if _stats["served_pixels"] else 0.0,
+    }
+
+
+def _open_rendition(rendition_path):
+    if rendition_path is None:
+        return None
+    with Image.open(rendition_path) as image:
+        image.load()
+        return image
+
+
+# --- UPLOAD RENDITIONS ---
+# What friends download: small WebP copies instead of the multi-megabyte original.
+UPLOAD_RENDITIONS = ("display", "thumbnail")
+UPLOAD_WEBP_QUALITY = 80
+
+
+def make_upload_renditions(image_path):
+    """
+    Returns {"display": webp_bytes, "thumbnail": webp_bytes} for an image file:
+    EXIF-oriented, resized, and with EXIF/GPS/XMP metadata left out (only the colour profile is kept).
+    """
+    largest = max(UPLOAD_RENDITIONS, key=lambda name: RENDITION_SIZES[name])
+    image, _ = _make_rendition(image_path, RENDITION_SIZES[largest])
+    icc_profile = image.info.get("icc_profile")
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    renditions = {}
+    for name in sorted(UPLOAD_RENDITIONS, key=lambda n: -RENDITION_SIZES[n]):
+        # Each smaller size is made from the previous one, so the original is decoded once
+        image.thumbnail((RENDITION_SIZES[name], RENDITION_SIZES[name]), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=UPLOAD_WEBP_QUALITY, method=4, icc_profile=icc_profile)
+        renditions[name] = buffer.getvalue()
+    return renditions
+
+
+# --- BATCH LOADING ---
+# Decoding big photos is CPU-bound, so cache misses are rendered in separate processes
+# (one per core) instead of threads that would fight over the GIL.
+# Workers are spawned, not forked: by the time the first batch runs, the Streamlit server
+# has notification, upload and summary threads holding locks that a fork would copy mid-use.
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+
+def load_images_parallel(image_paths, size="thumbnail"):
+    """
+    Yields (path, PIL Image or None) for each path, in the same order.
+    Every miss starts rendering right away; each result is yielded as soon as it
+    (and everything before it) is ready, so callers can draw a grid progressively.
+    """
+    pending = []
+    for path in image_paths:
+        if not path or not os.path.exists(path):
+            pending.append((path, None))
+            continue
+        cached = _find_cached(_rendition_path(path, size))
+        if cached:
+            _stats["hits"] += 1
+            pending.append((path, cached))
+        else:
+            pending.append((path, _get_process_pool().submit(_render, path, size)))
+
+    for path, job in pending:
+        try:
+            if hasattr(job, "result"):
+                rendition_path, timings = job.result()
+                _record(timings)  # the worker's own _stats die with its process
+            else:
+                rendition_path = job
+            yield path, _open_rendition(rendition_path)
+        except Exception as e:
+            print(f"Error loading image {path}: {e}")
+            yield path, None
+
+
+def load_image_for_streamlit(image_path, size="display"):
     """
     Loads an image from a path, corrects its orientation (EXIF),
     and returns a PIL Image object ready for st.image().
+    `size` picks a cached rendition ("thumbnail", "preview", "display");
+    size=None decodes the full-resolution original like before.
     Returns None if the file cannot be read.
     """
     if not image_path or not os.path.exists(image_path):
         return None
 
     try:
-        image = Image.open(image_path)
-        
-        # fix orientation (iPhone photos often appear rotated otherwise)
-        image = ImageOps.exif_transpose(image)
-        
-        return image
+        if size is None:
+            image = Image.open(image_path)
+
+            # fix orientation (iPhone photos often appear rotated otherwise)
+            image = ImageOps.exif_transpose(image)
+
+            return image
+
+        return _open_rendition(get_rendition(image_path, size))
     except Exception as e:
         print(f"Error loading image {image_path}: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -15,10 +15,50 @@ if sys.platform == "darwin": # Darwin = Mac
         # Try to continue without it, but we know it failed
         pass
 
+def _best_path(p):
+    """The best file we can show for a photo: original, then edited, then a preview. None if none exist."""
+    # STRATEGY 1: The Original (Best Quality)
+    if p.path and os.path.exists(p.path):
+        return p.path
+
+    # STRATEGY 2: The Edited Version
+    if p.path_edited and os.path.exists(p.path_edited):
+        return p.path_edited
+
+    # STRATEGY 3: The Preview/Thumbnail
+    derivatives = p.path_derivatives
+    if derivatives:
+        for derivative_path in reversed(derivatives):
+            if os.path.exists(derivative_path):
+                return derivative_path
+    return None
+
+
+def index_library():
+    """
+    Reads the whole library once and returns {"YYYY-MM-DD": [paths]} (Mac only).
+    Used by photo_index so step 1 doesn't rescan the library on every rerun.
+    Returns {} if not on a Mac or the library can't be read.
+    """
+    if sys.platform != "darwin" or osxphotos is None:
+        return {}
+    try:
+        by_date = {}
+        for p in osxphotos.PhotosDB().photos(movies=False):
+            valid_path = _best_path(p)
+            if valid_path:
+                by_date.setdefault(p.date.date().isoformat(), []).append(valid_path)
+        return by_date
+    except Exception as e:
+        print(f"❌ Error accessing Photos Library: {e}")
+        return {}
+
+
 def get_photos_from_mac_library(target_date):
     """
     Fetches photos using Auto-Discovery (Mac Only).
     Safe for Cloud: Returns empty list if not on Mac.
+    Scans the whole library on every call; photo_index.photos_for_date is the fast path.
     """
     
     # --- 2. SAFETY CHECK ---
@@ -41,25 +81,7 @@ def get_photos_from_mac_library(target_date):
             # Check if date matches (Year-Month-Day)
             if p.date.date() == target_date:
                 found_date_match = True
-                valid_path = None
-                
-                # STRATEGY 1: The Original (Best Quality)
-                if p.path and os.path.exists(p.path):
-                    valid_path = p.path
-                
-                # STRATEGY 2: The Edited Version
-                elif p.path_edited and os.path.exists(p.path_edited):
-                    valid_path = p.path_edited
-                
-                # STRATEGY 3: The Preview/Thumbnail
-                else:
-                    derivatives = p.path_derivatives
-                    if derivatives:
-                        for derivative_path in reversed(derivatives):
-                            if os.path.exists(derivative_path):
-                                valid_path = derivative_path
-                                print(f"  📸 Found Preview/Derivative: {valid_path}")
-                                break
+                valid_path = _best_path(p)
                 
                 # Final Decision
                 if valid_path:
@@ -74,4 +96,4 @@ def get_photos_from_mac_library(target_date):
 
     except Exception as e:
         print(f"❌ Error accessing Photos Library: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,149 @@
+"""
+Background notification polling.
+
+One thread per process polls Supabase for every logged-in user in a single query,
+puts new messages into an in-memory inbox, and marks the ones a session has drained
+read in one batched update. Streamlit reruns only read the inbox, so clicking around
+costs no network calls. Messages nobody drained stay unread in Supabase.
+
+    seq = notifications.subscribe("ryo")              # once per session
+    messages, seq = notifications.drain("ryo", seq)   # every rerun
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from modules import cloud_db
+
+POLL_INTERVAL_SECONDS = float(os.getenv("DIARY_NOTIFY_POLL_SECONDS", "15"))
+IDLE_SECONDS = 600  # stop polling for users nobody has drained in this long (tab closed)
+INBOX_SIZE = 50     # messages kept per user for sessions that haven't drained yet
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_users = {}        # username -> {"cursor": last id seen, "inbox": deque of (seq, message, id), "seq": int, "last_seen": t}
+_pending_acks = set()  # ids drained by a session, marked read on the next poll
+_thread = None
+_stats = {"polls": 0, "queries": 0, "delivered": 0, "acked": 0, "errors": 0}
+
+
+def _user(username):
+    state = _users.get(username)
+    if state is None:
+        state = _users[username] = {"cursor": 0, "inbox": deque(maxlen=INBOX_SIZE), "seq": 0,
+                                    "last_seen": time.monotonic()}
+    return state
+
+
+def _ensure_thread():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_run, daemon=True, name="notifications")
+        _thread.start()
+
+
+def subscribe(username):
+    """
+    Starts polling for username (if not already) and returns the session's starting position.
+    Messages that arrive after this call are returned by drain().
+    """
+    with _lock:
+        is_new = username not in _users
+        state = _user(username)
+        state["last_seen"] = time.monotonic()
+        _ensure_thread()
+    if is_new:
+        _wake.set()  # first session for this user: fetch what's already waiting right away
+    return state["seq"]
+
+
+def drain(username, since_seq):
+    """
+    Returns (new messages since since_seq, new position). No network I/O.
+    Returned messages are marked read in Supabase by the next poll.
+    """
+    with _lock:
+        state = _user(username)
+        state["last_seen"] = time.monotonic()
+        if since_seq > state["seq"]:
+            since_seq = 0  # the user went idle and their inbox was reset
+        fresh = [(message, row_id) for seq, message, row_id in state["inbox"] if seq > since_seq]
+        _pending_acks.update(row_id for _, row_id in fresh)
+        return [message for message, _ in fresh], state["seq"]
+
+
+def _flush_acks(client):
+    """Marks everything drained since the last flush as read, in one update."""
+    with _lock:
+        ids = list(_pending_acks)
+    if not ids:
+        return
+    try:
+        client.table("notifications").update({"is_read": True}).in_("id", ids).execute()
+        _stats["queries"] += 1
+    except Exception as e:
+        # Keep them queued; the cursor stops them from being delivered twice meanwhile
+        _stats["errors"] += 1
+        print(f"Notif Ack Error: {e}")
+        return
+    with _lock:
+        _pending_acks.difference_update(ids)
+        _stats["acked"] += len(ids)
+
+
+def poll_once(client=None):
+    """One poll cycle: acknowledge what sessions have drained, then fetch unread notifications for every active user."""
+    client = client or cloud_db.supabase
+    if client is None:
+        return
+    _flush_acks(client)
+    now = time.monotonic()
+    with _lock:
+        # Undrained messages of idle users were never acked, so they are fetched again next time
+        for username in [u for u, s in _users.items() if now - s["last_seen"] > IDLE_SECONDS]:
+            del _users[username]
+        cursors = {username: state["cursor"] for username, state in _users.items()}
+    if not cursors:
+        return
+
+    _stats["polls"] += 1
+    try:
+        res = client.table("notifications").select("id, user_id, message")\
+            .in_("user_id", list(cursors))\
+            .eq("is_read", False)\
+            .gt("id", min(cursors.values()))\
+            .order("id")\
+            .execute()
+        _stats["queries"] += 1
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"Notif Poll Error: {e}")
+        return
+
+    with _lock:
+        for row in res.data:
+            state = _users.get(row["user_id"])
+            # Drained rows whose ack is still queued are not delivered twice
+            if state is None or row["id"] <= state["cursor"] or row["id"] in _pending_acks:
+                continue
+            state["cursor"] = row["id"]
+            state["seq"] += 1
+            state["inbox"].append((state["seq"], row["message"], row["id"]))
+            _stats["delivered"] += 1
+
+
+def _run():
+    while True:
+        try:
+            poll_once()
+        except Exception as e:
+            print(f"Notif Poller Error: {e}")
+        _wake.wait(POLL_INTERVAL_SECONDS)
+        _wake.clear()
+
+
+def get_stats():
+    """Counters for the poller, e.g. {"polls": 40, "queries": 43, "delivered": 3, ...}."""
+    with _lock:
+        return {**_stats, "users": len(_users), "pending_acks": len(_pending_acks)}
@@ -0,0 +1,289 @@
+import datetime
+import json
+import os
+import threading
+import time
+
+from modules import exif_meta, mac_photos
+
+# watchdog keeps the index fresh while the app runs. Without it we only rescan at startup.
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+# Folders to index, separated like PATH (":" on Mac/Linux, ";" on Windows)
+PHOTO_DIRS = [d for d in os.getenv("PHOTO_DIRS", "").split(os.pathsep) if d]
+INDEX_FILE = "photo_index.json"
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".heic", ".heif"}
+SAVE_DELAY_SECONDS = 2.0  # bursts of file events are written to disk once
+# The Photos.app library (Mac only) as an extra source of suggestions. It is read once in
+# the background into its own date map and re-read at most every MAC_PHOTOS_REFRESH_SECONDS.
+USE_MAC_PHOTOS = os.getenv("DIARY_MAC_PHOTOS", "1") != "0"
+MAC_PHOTOS_REFRESH_SECONDS = 600
+
+_lock = threading.RLock()
+_files = {}    # path -> [mtime_ns, size, "YYYY-MM-DD" or None]
+_by_date = {}  # "YYYY-MM-DD" -> set of paths
+_started = False
+_ready = threading.Event()
+_observer = None
+_save_timer = None
+_mac_by_date = {}          # "YYYY-MM-DD" -> [paths] from the Photos library
+_mac_indexed_at = None     # monotonic time of the last library read (None = never)
+_mac_indexing = False
+
+
+def _is_photo(path):
+    return os.path.splitext(path)[1].lower() in PHOTO_EXTENSIONS
+
+
+def _forget(path):
+    record = _files.pop(path, None)
+    if record and record[2]:
+        paths = _by_date.get(record[2])
+        if paths:
+            paths.discard(path)
+            if not paths:
+                del _by_date[record[2]]
+
+
+def _remember(path, record):
+    _forget(path)
+    _files[path] = record
+    if record[2]:
+        _by_date.setdefault(record[2], set()).add(path)
+
+
+def _index_file(path):
+    """(Re)reads one file's date. Unchanged files (same mtime + size) are skipped. Returns True if changed."""
+    path = os.path.abspath(path)
+    if not _is_photo(path):
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        with _lock:
+            changed = path in _files
+            _forget(path)
+        return changed
+
+    with _lock:
+        known = _files.get(path)
+    if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+        return False
+
+    # EXIF header is read outside the lock so lookups never wait on disk.
+    # Photos without a capture date (screenshots, some exports) are filed under their EXIF DateTime.
+    meta = exif_meta.read_metadata(path)
+    record = [st.st_mtime_ns, st.st_size, meta["capture_date"] or meta["modified_date"]]
+    with _lock:
+        _remember(path, record)
+    return True
+
+
+def _forget_tree(folder):
+    prefix = os.path.abspath(folder) + os.sep
+    with _lock:
+        for path in [p for p in _files if p.startswith(prefix)]:
+            _forget(path)
+
+
+def _scan(folder):
+    """Walks a folder, indexing new/changed photos. Returns the set of photo paths seen."""
+    seen = set()
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.abspath(os.path.join(root, name))
+            if _is_photo(path):
+                seen.add(path)
+                _index_file(path)
+    return seen
+
+
+def _load():
+    if not os.path.exists(INDEX_FILE):
+        return
+    try:
+        with open(INDEX_FILE, "r") as f:
+            files = json.load(f).get("files", {})
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Photo index unreadable, rebuilding: {e}")
+        return
+    with _lock:
+        for path, record in files.items():
+            _remember(path, record)
+
+
+def save():
+    """Writes the index to INDEX_FILE (temp file + rename)."""
+    with _lock:
+        data = {"dirs": PHOTO_DIRS, "files": dict(_files)}
+    tmp_path = f"{INDEX_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, INDEX_FILE)
+
+
+def _schedule_save():
+    global _save_timer
+    with _lock:
+        if _save_timer is not None:
+            return
+        _save_timer = threading.Timer(SAVE_DELAY_SECONDS, _timed_save)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def _timed_save():
+    global _save_timer
+    with _lock:
+        _save_timer = None
+    try:
+        save()
+    except OSError as e:
+        print(f"❌ Photo index save failed: {e}")
+
+
+class _Handler(FileSystemEventHandler):
+    """Applies file create/modify/delete/move events to the index."""
+
+    def on_created(self, event):
+        if event.is_directory:
+            _scan(event.src_path)
+            _schedule_save()
+        elif _index_file(event.src_path):
+            _schedule_save()
+
+    def on_modified(self, event):
+        if not event.is_directory and _index_file(event.src_path):
+            _schedule_save()
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            _forget_tree(event.src_path)
+        else:
+            with _lock:
+                _forget(os.path.abspath(event.src_path))
+        _schedule_save()
+
+    def on_moved(self, event):
+        if event.is_directory:
+            _forget_tree(event.src_path)
+            _scan(event.dest_path)
+        else:
+            with _lock:
+                _forget(os.path.abspath(event.src_path))
+            _index_file(event.dest_path)
+        _schedule_save()
+
+
+def _build():
+    """Starts watching, then catches the saved index up with the disk."""
+    global _observer
+    try:
+        # Watch first, so photos added while the scan runs aren't missed (_index_file is idempotent)
+        if Observer is not None:
+            observer = Observer()
+            for folder in PHOTO_DIRS:
+                if os.path.isdir(folder):
+                    observer.schedule(_Handler(), folder, recursive=True)
+            observer.daemon = True
+            observer.start()
+            _observer = observer
+
+        seen = set()
+        for folder in PHOTO_DIRS:
+            if os.path.isdir(folder):
+                seen |= _scan(folder)
+            else:
+                print(f"⚠️ PHOTO_DIRS entry not found: {folder}")
+        with _lock:
+            # Files deleted while the app wasn't running (not ones that appeared during the scan)
+            for path in [p for p in _files if p not in seen and not os.path.exists(p)]:
+                _forget(path)
+        save()
+        print(f"🗂️ Photo index ready: {len(_files)} photos, {len(_by_date)} dates")
+    except Exception as e:
+        print(f"❌ Photo index error: {e}")
+    finally:
+        _ready.set()
+
+
+def _index_mac_library():
+    global _mac_by_date, _mac_indexed_at, _mac_indexing
+    try:
+        by_date = mac_photos.index_library()
+        with _lock:
+            _mac_by_date = by_date
+    finally:
+        with _lock:
+            _mac_indexed_at = time.monotonic()
+            _mac_indexing = False
+
+
+def _refresh_mac_library():
+    """Re-reads the Photos library in the background when its copy is missing or stale."""
+    global _mac_indexing
+    if not USE_MAC_PHOTOS or mac_photos.osxphotos is None:
+        return
+    with _lock:
+        fresh = _mac_indexed_at is not None and time.monotonic() - _mac_indexed_at < MAC_PHOTOS_REFRESH_SECONDS
+        if fresh or _mac_indexing:
+            return
+        _mac_indexing = True
+    threading.Thread(target=_index_mac_library, daemon=True, name="photo-index-mac").start()
+
+
+def start():
+    """
+    Loads the saved index and starts catching up + watching in the background (once per process).
+    Lookups work immediately from the saved index; new photos appear as they are found.
+    """
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    _refresh_mac_library()
+    if not PHOTO_DIRS:
+        _ready.set()
+        return
+    _load()
+    threading.Thread(target=_build, daemon=True, name="photo-index").start()
+
+
+def stop():
+    global _observer
+    if _observer is not None:
+        _observer.stop()
+        _observer.join()
+        _observer = None
+
+
+def wait_until_ready(timeout=None):
+    """Blocks until the startup scan has finished. Returns False on timeout."""
+    start()
+    return _ready.wait(timeout)
+
+
+def photos_for_date(target_date):
+    """
+    Paths of indexed photos taken on target_date (a date or "YYYY-MM-DD"): PHOTO_DIRS sorted,
+    then any extra ones from the Mac Photos library (if USE_MAC_PHOTOS).
+    """
+    start()
+    _refresh_mac_library()
+    if isinstance(target_date, (datetime.date, datetime.datetime)):
+        target_date = target_date.strftime("%Y-%m-%d")
+    with _lock:
+        paths = sorted(_by_date.get(target_date, ()))
+        return paths + [p for p in _mac_by_date.get(target_date, ()) if p not in paths]
+
+
+def get_index_stats():
+    with _lock:
+        return {"photos": len(_files), "dates": len(_by_date), "watching": _observer is not None,
+                "mac_photos": sum(len(paths) for paths in _mac_by_date.values())}
@@ -0,0 +1,167 @@
+import sqlite3
+import threading
+
+SQLITE_FILE = "diary_db.sqlite"
+
+# One shared connection; sqlite3 objects aren't safe to use from two threads at once
+_lock = threading.Lock()
+_conn = None
+_has_fts = True
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL UNIQUE,          -- UNIQUE gives us the date index
+    summary TEXT NOT NULL DEFAULT '',
+    audio_path TEXT,
+    image_path TEXT,
+    image_url TEXT,
+    is_edited INTEGER NOT NULL DEFAULT 0,
+    is_public INTEGER NOT NULL DEFAULT 0,
+    audio_codec TEXT NOT NULL DEFAULT 'wav',
+    original_audio_path TEXT
+);
+"""
+
+# Columns added after the first release; older files get them via ALTER TABLE
+ADDED_COLUMNS = {
+    "audio_codec": "TEXT NOT NULL DEFAULT 'wav'",
+    "original_audio_path": "TEXT",
+}
+
+# External-content FTS5 table, kept in sync by triggers so every write is incremental
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    summary, content='entries', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts(rowid, summary) VALUES (new.id, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, summary) VALUES ('delete', old.id, old.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE OF summary ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, summary) VALUES ('delete', old.id, old.summary);
+    INSERT INTO entries_fts(rowid, summary) VALUES (new.id, new.summary);
+END;
+"""
+
+
+def _connect():
+    """Opens (and if needed creates) the SQLite store. Caller holds _lock."""
+    global _conn, _has_fts
+    if _conn is not None:
+        return _conn
+
+    conn = sqlite3.connect(SQLITE_FILE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(entries)")}
+    for name, definition in ADDED_COLUMNS.items():
+        if name not in columns:
+            conn.execute(f"ALTER TABLE entries ADD COLUMN {name} {definition}")
+    try:
+        conn.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError as e:
+        # Some SQLite builds ship without FTS5. Search still works, just unranked.
+        print(f"⚠️ FTS5 unavailable, falling back to LIKE search: {e}")
+        _has_fts = False
+    conn.commit()
+    _conn = conn
+    return _conn
+
+
+def _row_to_entry(row):
+    return {
+        "summary": row["summary"],
+        "audio_path": row["audio_path"],
+        "image_path": row["image_path"],
+        "image_url": row["image_url"],
+        "is_edited": bool(row["is_edited"]),
+        "is_public": bool(row["is_public"]),
+        "audio_codec": row["audio_codec"] or "wav",
+        "original_audio_path": row["original_audio_path"]
+    }
+
+
+def load_db():
+    """Returns every entry in the same { "2025-12-17": {...} } format as the JSON store."""
+    with _lock:
+        rows = _connect().execute("SELECT * FROM entries ORDER BY date").fetchall()
+    return {row["date"]: _row_to_entry(row) for row in rows}
+
+
+def upsert_entry(date_str, entry):
+    """Inserts or replaces one entry. The FTS index is updated by trigger."""
+    with _lock:
+        conn = _connect()
+        conn.execute("""
+            INSERT INTO entries (date, summary, audio_path, image_path, image_url, is_edited, is_public,
+                                 audio_codec, original_audio_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                summary=excluded.summary, audio_path=excluded.audio_path,
+                image_path=excluded.image_path, image_url=excluded.image_url,
+                is_edited=excluded.is_edited, is_public=excluded.is_public,
+                audio_codec=excluded.audio_codec, original_audio_path=excluded.original_audio_path
+        """, (
+            date_str, entry.get("summary") or "", entry.get("audio_path"),
+            entry.get("image_path"), entry.get("image_url"),
+            int(bool(entry.get("is_edited"))), int(bool(entry.get("is_public"))),
+            entry.get("audio_codec") or "wav", entry.get("original_audio_path")
+        ))
+        conn.commit()
+
+
+def update_fields(date_str, **fields):
+    """Updates some columns of an existing entry. Unknown dates are ignored."""
+    allowed = {"summary", "audio_path", "image_path", "image_url", "is_edited", "is_public",
+               "audio_codec", "original_audio_path"}
+    fields = {k: v for k, v in fields.items() if k in allowed}
+    if not fields:
+        return
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    with _lock:
+        conn = _connect()
+        conn.execute(f"UPDATE entries SET {assignments} WHERE date = ?", (*fields.values(), date_str))
+        conn.commit()
+
+
+def _fts_query(term):
+    """Turns free text into a safe FTS5 query: quoted tokens, prefix match on the last one."""
+    tokens = [t.replace('"', '""') for t in term.split()]
+    if not tokens:
+        return None
+    quoted = [f'"{t}"' for t in tokens]
+    quoted[-1] += "*"  # so results show up while the user is still typing
+    return " ".join(quoted)
+
+
+def search(term, limit=20):
+    """
+    Full-text search over summaries.
+    Returns a ranked list like [{"date": "2025-12-17", "snippet": "...**Seattle**..."}].
+    """
+    query = _fts_query(term)
+    if query is None:
+        return []
+
+    with _lock:
+        conn = _connect()
+        if _has_fts:
+            rows = conn.execute("""
+                SELECT e.date, snippet(entries_fts, 0, '**', '**', '…', 12) AS snippet
+                FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid
+                WHERE entries_fts MATCH ?
+                ORDER BY bm25(entries_fts)
+                LIMIT ?
+            """, (query, limit)).fetchall()
+        else:
+            rows = conn.execute("""
+                SELECT date, summary AS snippet FROM entries
+                WHERE summary LIKE ? ORDER BY date DESC LIMIT ?
+            """, (f"%{term}%", limit)).fetchall()
+
+    return [{"date": row["date"], "snippet": row["snippet"]} for row in rows]
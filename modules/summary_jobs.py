@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from modules import ai, audio
+
+# Summaries run on worker threads so the Streamlit script never blocks on Gemini
+# (or on trimming and encoding the raw recording, which the worker does first).
+# Job state lives in SQLite and the audio is kept on disk until the job is collected,
+# so a job survives reruns, new browser sessions, and even a server restart.
+JOBS_FILE = "summary_jobs.sqlite"
+JOBS_AUDIO_DIR = "summary_jobs"
+JOB_WORKERS = 4
+JOB_MAX_AGE_SECONDS = 7 * 24 * 3600  # finished jobs nobody collected (tab closed) are deleted after this
+
+_lock = threading.Lock()
+_conn = None
+_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="summary")
+_cancel_events = {}  # job id -> threading.Event, for jobs that haven't finished
+
+
+def _db():
+    """Opens the job table (caller holds _lock)."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(JOBS_FILE, check_same_thread=False)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,                 -- who recorded it; only they can resume it
+                status TEXT NOT NULL,         -- queued, running, done, failed, cancelled
+                audio_path TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                partial TEXT,                 -- summary so far, while it streams in
+                pending_trim INTEGER,         -- NULL once the audio is encoded; 0/1 (trim?) while it is still raw WAV
+                trimmed_seconds REAL,         -- silence removed while preparing
+                summary TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Older job tables won't have the streaming / owner columns yet
+        columns = {row["name"] for row in _conn.execute("PRAGMA table_info(jobs)")}
+        if "partial" not in columns:
+            _conn.execute("ALTER TABLE jobs ADD COLUMN partial TEXT")
+        if "user_id" not in columns:
+            _conn.execute("ALTER TABLE jobs ADD COLUMN user_id TEXT")
+        if "pending_trim" not in columns:
+            _conn.execute("ALTER TABLE jobs ADD COLUMN pending_trim INTEGER")
+            _conn.execute("ALTER TABLE jobs ADD COLUMN trimmed_seconds REAL")
+        _conn.commit()
+    return _conn
+
+
+def _set(job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    with _lock:
+        conn = _db()
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+
+
+def _prepare(job_id, raw_audio, trim):
+    """Trims (optionally) and encodes the raw recording, replacing the job's audio copy. Returns (data, codec)."""
+    data, codec, report = audio.process_recording(raw_audio, trim=trim)
+    job = get_job(job_id)
+    if job is None:
+        return data, codec  # abandoned meanwhile; _run notices the cancel event next
+    audio_path = os.path.join(JOBS_AUDIO_DIR, f"{job_id}.{audio.extension(codec)}")
+    tmp_path = f"{audio_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, audio_path)
+    _set(job_id, audio_path=audio_path, codec=codec, pending_trim=None,
+         trimmed_seconds=report["removed_seconds"] if report else None)
+    if job["audio_path"] != audio_path and os.path.exists(job["audio_path"]):
+        os.remove(job["audio_path"])
+    return data, codec
+
+
+def _run(job_id, audio_bytes, codec, pending_trim=None):
+    """Worker: prepares the recording if it is still raw, then streams its summary and records the outcome."""
+    cancel_event = _cancel_events.setdefault(job_id, threading.Event())
+    if cancel_event.is_set() or get_job(job_id) is None:
+        # Cancelled or finished (abandoned) while it was waiting in the queue
+        _cancel_events.pop(job_id, None)
+        return
+    _set(job_id, status="running")
+    try:
+        if pending_trim is not None:
+            audio_bytes, codec = _prepare(job_id, audio_bytes, bool(pending_trim))
+        summary = None
+        for summary in ai.stream_summary(audio_bytes, codec=codec, cancel_event=cancel_event):
+            _set(job_id, partial=summary)
+        if cancel_event.is_set():
+            _set(job_id, status="cancelled")
+        else:
+            _set(job_id, status="done", summary=summary)
+    except Exception as e:
+        print(f"❌ Summary job {job_id} failed: {e}")
+        _set(job_id, status="failed", error=str(e))
+    finally:
+        _cancel_events.pop(job_id, None)
+
+
+def submit(audio_bytes, codec="wav", user_id=None, prepare=False, trim=True):
+    """
+    Queues user_id's recording for summarization and returns its job id right away.
+    With prepare=True, audio_bytes is the raw WAV from the recorder: the worker trims it
+    (if trim) and encodes it first. get_job() then reports the new codec and
+    trimmed_seconds, and load_job_audio() returns the encoded file.
+    """
+    job_id = uuid.uuid4().hex
+    if prepare:
+        codec = "wav"
+    os.makedirs(JOBS_AUDIO_DIR, exist_ok=True)
+    audio_path = os.path.join(JOBS_AUDIO_DIR, f"{job_id}.{audio.extension(codec)}")
+    with open(audio_path, "wb") as f:
+        f.write(audio_bytes)
+
+    pending_trim = int(bool(trim)) if prepare else None
+    now = time.time()
+    with _lock:
+        conn = _db()
+        conn.execute(
+            "INSERT INTO jobs (id, user_id, status, audio_path, codec, pending_trim, created_at, updated_at)"
+            " VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, user_id, audio_path, codec, pending_trim, now, now)
+        )
+        conn.commit()
+
+    _pool.submit(_run, job_id, audio_bytes, codec, pending_trim)
+    return job_id
+
+
+def cancel(job_id):
+    """Stops a job that's still queued or generating. Its partial text is discarded."""
+    _cancel_events.setdefault(job_id, threading.Event()).set()
+    job = get_job(job_id)
+    if job and job["status"] == "queued":
+        _set(job_id, status="cancelled")
+
+
+def get_job(job_id):
+    """
+    Returns {"id", "user_id", "status", "partial", "summary", "error", "codec", "audio_path",
+    "trimmed_seconds", ...} or None if unknown.
+    """
+    with _lock:
+        row = _db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def load_job_audio(job_id):
+    """Reads back the recording for a job (e.g. after a new session picks it up)."""
+    job = get_job(job_id)
+    if not job or not os.path.exists(job["audio_path"]):
+        return None
+    with open(job["audio_path"], "rb") as f:
+        return f.read()
+
+
+def finish_job(job_id):
+    """
+    Forgets a job and deletes its audio copy: after its result has been saved, or when
+    the user abandons it (cancel, record again, switch date). A queued or running job is
+    stopped first, so it never reaches Gemini (or stops streaming).
+    """
+    job = get_job(job_id)
+    if job is None:
+        return
+    if job["status"] in ("queued", "running"):
+        _cancel_events.setdefault(job_id, threading.Event()).set()
+    if os.path.exists(job["audio_path"]):
+        os.remove(job["audio_path"])
+    with _lock:
+        conn = _db()
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        conn.commit()
+
+
+def _resume_unfinished():
+    """After a restart, re-queue anything that was still waiting or running."""
+    with _lock:
+        rows = _db().execute(
+            "SELECT id, audio_path, codec, pending_trim FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchall()
+    for row in rows:
+        if not os.path.exists(row["audio_path"]):
+            _set(row["id"], status="failed", error="Recording was lost before it could be summarized.")
+            continue
+        with open(row["audio_path"], "rb") as f:
+            audio_bytes = f.read()
+        _set(row["id"], status="queued")
+        _pool.submit(_run, row["id"], audio_bytes, row["codec"], row["pending_trim"])
+
+
+def cleanup_stale_jobs(max_age_seconds=None):
+    """Deletes finished jobs (and stray audio copies) untouched for longer than max_age_seconds."""
+    cutoff = time.time() - (JOB_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds)
+    with _lock:
+        conn = _db()
+        rows = conn.execute(
+            "SELECT id FROM jobs WHERE updated_at < ? AND status NOT IN ('queued', 'running')", (cutoff,)
+        ).fetchall()
+        known_audio = {row["audio_path"] for row in conn.execute("SELECT audio_path FROM jobs")}
+    for row in rows:
+        finish_job(row["id"])
+
+    # Audio written by submit() whose row never got inserted (crash in between)
+    if os.path.isdir(JOBS_AUDIO_DIR):
+        for entry in os.scandir(JOBS_AUDIO_DIR):
+            if entry.path not in known_audio and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+    if rows:
+        print(f"🧹 Removed {len(rows)} abandoned summary jobs")
+
+
+_resume_unfinished()
+cleanup_stale_jobs()